@@ -1,21 +1,25 @@
+import logging
 import os
 import shutil
 import uuid
-import zipfile
-from pathlib import Path
 
 from fastapi import APIRouter, File, Form, UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
 from backend.db.orm import SyncOrm
+from backend.app.services.archive import archive_suffix, extract_archive, save_upload
 from backend.app.services.storage import (
-    ensure_buckets,
-    get_minio_client,
+    DatasetUploader,
     restore_dataset_tree_from_minio,
     restore_models_tree_from_minio,
+    upload_dataset_tree,
 )
 from backend.app.services.drive import download_folder_to
 from backend.app.tasks import train_task
+from backend.exception.file_system import ArchiveError, UploadTooLargeError
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -24,28 +28,54 @@ class DriveJobRequest(BaseModel):
     folder_id: str
 
 
-def _safe_extract_zip(zf: zipfile.ZipFile, dest: str) -> None:
-    dest_abs = os.path.abspath(dest)
-    for m in zf.infolist():
-        if m.is_dir():
-            continue
-        target = os.path.normpath(os.path.join(dest_abs, m.filename))
-        if not (target == dest_abs or target.startswith(dest_abs + os.sep)):
-            raise ValueError("Unsafe path in ZIP")
-        parent = os.path.dirname(target)
-        if parent:
-            os.makedirs(parent, exist_ok=True)
-        with zf.open(m, "r") as src, open(target, "wb") as out:
-            shutil.copyfileobj(src, out)
+ARCHIVES_ONLY = "Only zip, tar, tar.gz and tar.zst archives are accepted"
+
+
+async def _receive_archive(
+    file: UploadFile,
+    folder_path: str,
+    name: str,
+    uploader: DatasetUploader | None = None,
+) -> str:
+    """
+    Записать архив из запроса на диск потоком и распаковать в folder_path (в пуле
+    потоков, не блокируя цикл событий). Архив удаляется; распакованные файлы сразу
+    ставятся в очередь uploader. Возвращает sha256 архива.
+    """
+    archive_path = os.path.join(folder_path, name + archive_suffix(file.filename))
+    try:
+        size, sha256 = await save_upload(file, archive_path)
+        files = await run_in_threadpool(
+            extract_archive, archive_path, folder_path, on_file=uploader.add if uploader else None
+        )
+        logger.info("Архив %s: %d байт, sha256 %s, файлов %d", file.filename, size, sha256, files)
+        return sha256
+    except (UploadTooLargeError, ArchiveError) as e:
+        raise HTTPException(413 if isinstance(e, UploadTooLargeError) else 400, str(e))
+    finally:
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+
+
+def _finish_upload(uploader: DatasetUploader, folder_id: str) -> None:
+    """
+    Дождаться загрузки датасета в MinIO после постановки обучения. Ошибка не отменяет
+    задачу: worker обучает по локальной копии, а синхронизация после обучения
+    загрузит недостающие файлы. Манифесты дописываются, а не перезаписываются, поэтому
+    синхронизация после быстро завершившегося обучения не теряет эти файлы.
+    """
+    try:
+        uploader.close()
+    except Exception:
+        logger.exception("Датасет %s: загрузка в MinIO не завершена", folder_id)
 
 
 @router.get("/{folder_id}/meta")
 def dataset_meta(folder_id: str):
-    total, pending = SyncOrm.dataset_stats(folder_id)
-    has_model = SyncOrm.select_model(folder_id) is not None
-    task_type = None
-    if has_model:
-        *_, task_type = SyncOrm.select_model(folder_id)
+    total, pending = SyncOrm.dataset_stats_cached(folder_id)
+    model = SyncOrm.select_model_cached(folder_id)
+    has_model = model is not None
+    task_type = model[-1] if has_model else None
     return {
         "folder_id": folder_id,
         "files_total": total,
@@ -61,10 +91,10 @@ async def retrain_dataset(
     file: UploadFile = File(...),
     task_type: str | None = Form(None),
 ):
-    if not file.filename or not file.filename.lower().endswith(".zip"):
-        raise HTTPException(400, "Only ZIP archives are accepted")
+    if not archive_suffix(file.filename):
+        raise HTTPException(400, ARCHIVES_ONLY)
 
-    row = SyncOrm.select_model(folder_id)
+    row = SyncOrm.select_model_cached(folder_id)
     if not row:
         raise HTTPException(
             404,
@@ -86,7 +116,7 @@ async def retrain_dataset(
         os.makedirs(folder_path, exist_ok=True)
 
     if not os.listdir(folder_path):
-        restored = restore_dataset_tree_from_minio(folder_id, folder_path)
+        restored = await run_in_threadpool(restore_dataset_tree_from_minio, folder_id, folder_path)
         if not restored:
             raise HTTPException(
                 404,
@@ -99,43 +129,33 @@ async def retrain_dataset(
         model_rel if os.path.isabs(model_rel) else os.path.join(job_root, model_rel)
     )
     if not os.path.isfile(abs_model):
-        restore_models_tree_from_minio(folder_id, job_root)
+        await run_in_threadpool(restore_models_tree_from_minio, folder_id, job_root)
 
-    zip_path = os.path.join(folder_path, "retrain_upload.zip")
+    # Новые файлы загружаются в MinIO параллельно с распаковкой; если архив не прошёл
+    # проверку, уже загруженные объекты удаляются (abort)
+    uploader = DatasetUploader(folder_path, folder_id)
     try:
-        content = await file.read()
-        with open(zip_path, "wb") as f:
-            f.write(content)
-        with zipfile.ZipFile(zip_path, "r") as zf:
-            _safe_extract_zip(zf, folder_path)
-    finally:
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
-
-    task_dir = None
-    for root, dirs, _ in os.walk(folder_path):
-        if "dataset" in dirs:
-            task_dir = root
-            break
-    if not task_dir:
-        raise HTTPException(400, "В архиве или проекте должна быть папка dataset")
+        await _receive_archive(file, folder_path, "retrain_upload", uploader=uploader)
 
-    ensure_buckets()
-    client = get_minio_client()
-    for f in Path(folder_path).rglob("*"):
-        if f.is_file():
-            rel = f.relative_to(Path(folder_path))
-            obj = f"datasets/{folder_id}/{rel.as_posix()}"
-            client.fput_object("datasets", obj, str(f))
+        task_dir = await run_in_threadpool(_find_task_dir, folder_path)
+        if not task_dir:
+            raise HTTPException(400, "В архиве или проекте должна быть папка dataset")
+        await run_in_threadpool(_validate_dataset, os.path.join(task_dir, "dataset"), task)
+    except BaseException:
+        await run_in_threadpool(uploader.abort)
+        raise
 
-    t = train_task.delay(folder_id, task_dir, task)
+    try:
+        t = train_task.delay(folder_id, task_dir, task)
+    finally:
+        await run_in_threadpool(_finish_upload, uploader, folder_id)
     return {"job_id": t.id, "folder_id": folder_id, "task": task}
 
 
 @router.post("/upload")
 async def upload_dataset(file: UploadFile = File(...)):
-    if not file.filename or not file.filename.lower().endswith(".zip"):
-        raise HTTPException(400, "Only ZIP archives are accepted")
+    if not archive_suffix(file.filename):
+        raise HTTPException(400, ARCHIVES_ONLY)
 
     job_id = str(uuid.uuid4())
     data_path = os.environ.get("ML_DATA_PATH", "/data")
@@ -144,44 +164,42 @@ async def upload_dataset(file: UploadFile = File(...)):
     folder_path = os.path.join(data_path, job_id)
 
     os.makedirs(folder_path, exist_ok=True)
-    zip_path = os.path.join(folder_path, "upload.zip")
-
+    # Store in MinIO: файлы загружаются параллельно с распаковкой, обучение ставится
+    # в очередь, как только датасет на диске и проверен; при отказе загруженное удаляется
+    uploader = DatasetUploader(folder_path, job_id)
     try:
-        content = await file.read()
-        with open(zip_path, "wb") as f:
-            f.write(content)
-
-        with zipfile.ZipFile(zip_path, "r") as zf:
-            _safe_extract_zip(zf, folder_path)
-
-        # Find folder that contains dataset/
-        task_dir = None
-        for root, dirs, _ in os.walk(folder_path):
-            if "dataset" in dirs:
-                task_dir = root
-                break
+        archive_sha256 = await _receive_archive(file, folder_path, "upload", uploader=uploader)
+
+        task_dir = await run_in_threadpool(_find_task_dir, folder_path)
         if not task_dir:
-            raise HTTPException(400, "ZIP must contain a 'dataset' folder")
+            raise HTTPException(400, "Archive must contain a 'dataset' folder")
 
         dataset_path = os.path.join(task_dir, "dataset")
-        task = _detect_task(dataset_path)
-
-        # Store in MinIO
-        ensure_buckets()
-        client = get_minio_client()
-        for f in Path(folder_path).rglob("*"):
-            if f.is_file():
-                rel = f.relative_to(folder_path)
-                obj = f"datasets/{job_id}/{rel.as_posix()}"
-                client.fput_object("datasets", obj, str(f))
+        task = await run_in_threadpool(_detect_task, dataset_path)
+        await run_in_threadpool(_validate_dataset, dataset_path, task)
+    except BaseException:
+        await run_in_threadpool(uploader.abort)
+        shutil.rmtree(folder_path, ignore_errors=True)
+        raise
 
+    try:
         t = train_task.delay(job_id, task_dir, task)
-        return {"job_id": t.id, "folder_id": job_id, "task": task}
-    except zipfile.BadZipFile:
-        raise HTTPException(400, "Invalid ZIP file")
     finally:
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
+        await run_in_threadpool(_finish_upload, uploader, job_id)
+    return {
+        "job_id": t.id,
+        "folder_id": job_id,
+        "task": task,
+        "archive_sha256": archive_sha256,
+    }
+
+
+def _find_task_dir(folder_path: str) -> str | None:
+    """Первая папка (обход сверху вниз), содержащая dataset/."""
+    for root, dirs, _ in os.walk(folder_path):
+        if "dataset" in dirs:
+            return root
+    return None
 
 
 def _detect_task(dataset_path: str) -> str:
@@ -189,6 +207,27 @@ def _detect_task(dataset_path: str) -> str:
     return determine_task_type(dataset_path)
 
 
+def _validate_dataset(dataset_path: str, task: str, cleanup: str | None = None) -> None:
+    """Проверить датасет до постановки задачи; 400 с отчётом, если есть ошибки."""
+    from backend.dataset.validation import validate_dataset
+    from backend.exception.file_system import DatasetValidationError
+
+    report = validate_dataset(dataset_path, task)
+    if report.skipped:
+        logger.warning(
+            "Датасет %s: пропущено файлов не изображений %d (%s)",
+            dataset_path,
+            len(report.skipped),
+            ", ".join(report.skipped[:10]),
+        )
+    if report.ok:
+        return
+    if cleanup:
+        shutil.rmtree(cleanup, ignore_errors=True)
+    error = DatasetValidationError(report)
+    raise HTTPException(400, {"message": str(error), **report.to_dict()})
+
+
 @router.post("/from-drive")
 async def start_job_from_drive(body: DriveJobRequest):
     """Скачать датасет из Google Drive и запустить обучение."""
@@ -208,25 +247,15 @@ async def start_job_from_drive(body: DriveJobRequest):
     except Exception as e:
         raise HTTPException(500, f"Ошибка загрузки с Drive: {e}")
 
-    # Find task_dir (folder containing dataset/)
-    task_dir = None
-    for root, dirs, _ in os.walk(folder_path):
-        if "dataset" in dirs:
-            task_dir = root
-            break
+    task_dir = _find_task_dir(folder_path)
     if not task_dir:
         raise HTTPException(400, "Папка Drive должна содержать подпапку dataset")
 
     dataset_path = os.path.join(task_dir, "dataset")
     task = _detect_task(dataset_path)
+    _validate_dataset(dataset_path, task, cleanup=folder_path)
 
-    ensure_buckets()
-    client = get_minio_client()
-    for f in Path(folder_path).rglob("*"):
-        if f.is_file():
-            rel = f.relative_to(folder_path)
-            obj = f"datasets/{job_id}/{rel.as_posix()}"
-            client.fput_object("datasets", obj, str(f))
+    upload_dataset_tree(folder_path, job_id)
 
     t = train_task.delay(job_id, task_dir, task)
     return {"job_id": t.id, "folder_id": job_id, "task": task}
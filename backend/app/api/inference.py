@@ -7,8 +7,10 @@ from fastapi.responses import StreamingResponse
 from minio.error import S3Error
 
 from backend.db.orm import SyncOrm
+from backend.app.services.archive import archive_suffix, save_upload
 from backend.app.services.storage import get_minio_client, iter_minio_object_chunks
 from backend.app.tasks import infer_task
+from backend.exception.file_system import UploadTooLargeError
 
 logger = logging.getLogger(__name__)
 
@@ -21,10 +23,13 @@ async def start_inference(
     file: UploadFile = File(...),
     task_type: str = Form(...),
 ):
-    if not file.filename or not file.filename.lower().endswith(".zip"):
-        raise HTTPException(400, "Нужен ZIP-архив с тестовыми изображениями")
+    suffix = archive_suffix(file.filename)
+    if not suffix:
+        raise HTTPException(
+            400, "Нужен архив (zip, tar, tar.gz, tar.zst) с тестовыми изображениями"
+        )
 
-    row = SyncOrm.select_model(folder_id)
+    row = SyncOrm.select_model_cached(folder_id)
     if not row:
         raise HTTPException(404, "Модель не найдена для этого folder_id")
 
@@ -32,11 +37,12 @@ async def start_inference(
     upload_dir = os.path.join(data_path, folder_id, "inference_uploads")
     os.makedirs(upload_dir, exist_ok=True)
     inference_upload_id = str(uuid.uuid4())
-    zip_path = os.path.join(upload_dir, f"{inference_upload_id}.zip")
+    zip_path = os.path.join(upload_dir, f"{inference_upload_id}{suffix}")
 
-    content = await file.read()
-    with open(zip_path, "wb") as f:
-        f.write(content)
+    try:
+        await save_upload(file, zip_path)
+    except UploadTooLargeError as e:
+        raise HTTPException(413, str(e))
 
     try:
         t = infer_task.delay(folder_id, task_type, zip_path, inference_upload_id)
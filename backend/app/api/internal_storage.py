@@ -5,6 +5,7 @@ from fastapi import APIRouter, Header, HTTPException
 from pydantic import BaseModel, Field
 
 from backend.config import settings
+from backend.db.cache import metadata_cache
 from backend.app.services.storage import (
     sync_task_artifacts_to_minio,
     upload_inference_zip_to_results,
@@ -33,6 +34,8 @@ def sync_storage_after_train(
     if not expected or (x_internal_token or "").strip() != expected:
         raise HTTPException(status_code=403, detail="Forbidden")
     sync_task_artifacts_to_minio(body.task_folder, body.job_id)
+    # Модель и флаги обучения записал worker (другой процесс)
+    metadata_cache.invalidate(body.job_id)
     return {"ok": True}
 
 
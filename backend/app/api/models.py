@@ -1,6 +1,9 @@
+import base64
+import binascii
+import json
 from datetime import datetime
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Response
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
@@ -22,9 +25,34 @@ class ModelListItem(BaseModel):
     trained_at: datetime | None = None
 
 
+def _encode_cursor(row) -> str:
+    trained_at = row.trained_at.isoformat() if row.trained_at else None
+    raw = json.dumps([trained_at, row.train_folder]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime | None, str]:
+    try:
+        trained_at, folder = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (datetime.fromisoformat(trained_at) if trained_at else None), str(folder)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(400, "Некорректный курсор")
+
+
 @router.get("", response_model=list[ModelListItem])
-def list_models():
-    rows = SyncOrm.list_models_latest()
+def list_models(
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=1000),
+    cursor: str | None = None,
+):
+    """
+    Последние версии моделей. С limit — постранично: курсор следующей страницы
+    приходит в заголовке X-Next-Cursor (нет заголовка — страница последняя).
+    """
+    after = _decode_cursor(cursor) if cursor else None
+    rows = SyncOrm.list_models_latest(limit=limit, after=after)
+    if limit is not None and len(rows) == limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1])
     return [
         ModelListItem(
             train_folder=r.train_folder,
@@ -40,7 +68,7 @@ def list_models():
 
 @router.get("/{folder_id}/download")
 def download_model(folder_id: str):
-    model = SyncOrm.select_model(folder_id)
+    model = SyncOrm.select_model_cached(folder_id)
     if not model:
         raise HTTPException(404, "Model not found")
     return {"download_url": f"/api/models/{folder_id}/weights"}
@@ -48,7 +76,7 @@ def download_model(folder_id: str):
 
 @router.get("/{folder_id}/weights")
 def download_model_weights_stream(folder_id: str):
-    model = SyncOrm.select_model(folder_id)
+    model = SyncOrm.select_model_cached(folder_id)
     if not model:
         raise HTTPException(404, "Model not found")
     _path, version, _, _, _ = model
@@ -22,6 +22,12 @@ async def lifespan(app: FastAPI):
                     "ALTER TABLE models ADD COLUMN IF NOT EXISTS trained_at TIMESTAMPTZ"
                 )
             )
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS models_folder_version_index "
+                    "ON models (train_folder, version DESC, id DESC)"
+                )
+            )
     except Exception:
         pass
 
@@ -45,6 +51,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.include_router(datasets.router, prefix="/api/datasets", tags=["datasets"])
@@ -0,0 +1,144 @@
+"""
+Приём и распаковка архивов датасетов и тестовых изображений.
+
+Тело загрузки пишется на диск блоками фиксированного размера (лимит UPLOAD_MAX_BYTES,
+sha256 считается по ходу записи), распаковка читает архив потоком: память backend
+не зависит от размера архива. Поддерживаются zip, tar, tar.gz/tgz и tar.zst/tzst
+(последний — при установленном пакете zstandard). Формат определяется по сигнатуре,
+а не по имени файла.
+"""
+import hashlib
+import os
+import shutil
+import tarfile
+import zipfile
+from collections.abc import Callable
+
+from backend.config import settings
+from backend.exception.file_system import ArchiveError, UploadTooLargeError
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.zst", ".tzst")
+
+_ZIP_MAGIC = b"PK\x03\x04"
+_EMPTY_ZIP_MAGIC = b"PK\x05\x06"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def archive_suffix(filename: str | None) -> str | None:
+    """Расширение архива из ARCHIVE_SUFFIXES (с учётом .tar.gz) или None."""
+    name = (filename or "").lower()
+    for suffix in sorted(ARCHIVE_SUFFIXES, key=len, reverse=True):
+        if name.endswith(suffix):
+            return suffix
+    return None
+
+
+async def save_upload(
+    upload,
+    dest_path: str,
+    max_bytes: int | None = None,
+    chunk_size: int | None = None,
+) -> tuple[int, str]:
+    """
+    Записать загружаемый файл (UploadFile) в dest_path блоками.
+    Возвращает (размер, sha256); при превышении max_bytes файл удаляется и
+    поднимается UploadTooLargeError.
+    """
+    max_bytes = settings.UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_BYTES
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(dest_path, "wb") as out:
+            while chunk := await upload.read(chunk_size):
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+    return size, digest.hexdigest()
+
+
+def _target(dest_abs: str, name: str) -> str:
+    target = os.path.normpath(os.path.join(dest_abs, name))
+    if not (target == dest_abs or target.startswith(dest_abs + os.sep)):
+        raise ArchiveError(f"Недопустимый путь в архиве: {name}")
+    return target
+
+
+def _write_member(src, target: str) -> None:
+    parent = os.path.dirname(target)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    with open(target, "wb") as out:
+        shutil.copyfileobj(src, out, settings.UPLOAD_CHUNK_BYTES)
+
+
+def _extract_zip(path: str, dest_abs: str, on_file: Callable[[str], None] | None) -> int:
+    n = 0
+    try:
+        with zipfile.ZipFile(path, "r") as zf:
+            for m in zf.infolist():
+                if m.is_dir():
+                    continue
+                target = _target(dest_abs, m.filename)
+                with zf.open(m, "r") as src:
+                    _write_member(src, target)
+                if on_file:
+                    on_file(target)
+                n += 1
+    except zipfile.BadZipFile as e:
+        raise ArchiveError(f"Повреждённый ZIP: {e}") from e
+    return n
+
+
+def _extract_tar_stream(fileobj, dest_abs: str, on_file: Callable[[str], None] | None) -> int:
+    """Потоковое чтение tar (режим r|*): только обычные файлы, ссылки и устройства пропускаются."""
+    n = 0
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r|*") as tf:
+            for m in tf:
+                if not m.isfile():
+                    continue
+                target = _target(dest_abs, m.name)
+                src = tf.extractfile(m)
+                if src is None:
+                    continue
+                _write_member(src, target)
+                if on_file:
+                    on_file(target)
+                n += 1
+    except tarfile.TarError as e:
+        raise ArchiveError(f"Повреждённый tar-архив: {e}") from e
+    return n
+
+
+def _zstd_reader(f):
+    try:
+        import zstandard
+    except ImportError:
+        raise ArchiveError("Для архивов .tar.zst нужен пакет zstandard")
+    return zstandard.ZstdDecompressor().stream_reader(f)
+
+
+def extract_archive(path: str, dest: str, on_file: Callable[[str], None] | None = None) -> int:
+    """
+    Распаковать архив path в dest (без выхода за его пределы). Возвращает число файлов.
+    on_file вызывается с путём каждого файла сразу после записи (загрузка в хранилище
+    параллельно с распаковкой).
+    """
+    dest_abs = os.path.abspath(dest)
+    with open(path, "rb") as f:
+        magic = f.read(4)
+        f.seek(0)
+        if magic.startswith(_ZSTD_MAGIC):
+            with _zstd_reader(f) as reader:
+                return _extract_tar_stream(reader, dest_abs, on_file)
+        if magic not in (_ZIP_MAGIC, _EMPTY_ZIP_MAGIC):
+            # tar и tar.gz (а также bz2/xz) tarfile распознаёт сам
+            return _extract_tar_stream(f, dest_abs, on_file)
+    return _extract_zip(path, dest_abs, on_file)
@@ -4,14 +4,20 @@ Pipeline service: обучение и дообучение в веб-стеке
 """
 from __future__ import annotations
 
+import logging
 import os
 import shutil
 from collections.abc import Callable
 
+from backend.config import settings
+from backend.dataset.delta import FineTunePlan, plan_fine_tune
+from backend.dataset.manifest import DatasetManifest
 from backend.dataset.splitting import DataSpliting
 from ml.model import Model
 from backend.db.orm import SyncOrm
 
+logger = logging.getLogger(__name__)
+
 
 def run_pipeline(
     folder: str,
@@ -36,10 +42,16 @@ def run_pipeline(
     _p("indexing_files")
     SyncOrm.create_tables()
 
-    for root, _, files in os.walk(folder):
-        if os.path.basename(root) not in ("test", "results", "masks"):
-            for file in files:
-                SyncOrm.insert_data({"train_folder": folder_id, "path": os.path.join(root, file)})
+    manifest = DatasetManifest.load_or_build(folder)
+    indexed = SyncOrm.insert_data_bulk(
+        folder_id,
+        (
+            path
+            for path in manifest.iter_files()
+            if os.path.basename(os.path.dirname(path)) not in ("test", "results", "masks")
+        ),
+    )
+    logger.info("Индексация: новых файлов %d из %d", indexed, len(manifest.files))
 
     data_root = os.path.join(os.path.dirname(folder), "data_root")
 
@@ -58,6 +70,7 @@ def run_pipeline(
             data_root,
             _p,
             task_type,
+            manifest,
         )
     elif task_type == "классификация":
         _train_or_retrain(
@@ -68,18 +81,55 @@ def run_pipeline(
             data_root,
             _p,
             task_type,
+            manifest,
         )
 
     if os.path.exists(data_root):
         shutil.rmtree(data_root)
-
-
-def _train_or_retrain(model_type, split_func, folder, path_dataset, data_root, _p, task_type: str):
+    # В режиме list Ultralytics кладёт кэш разметки рядом с исходной labels/
+    labels_cache = os.path.join(path_dataset, "labels.cache")
+    if os.path.exists(labels_cache):
+        os.remove(labels_cache)
+
+
+def _plan_fine_tune(
+    path_dataset: str, task_type: str, pending_paths: list[str], manifest: DatasetManifest
+) -> FineTunePlan:
+    base_epochs = settings.FINE_TUNE_EPOCHS
+    if settings.FINE_TUNE_MODE != "incremental":
+        return FineTunePlan(subset=None, new=len(pending_paths), total=0, epochs=base_epochs)
+    plan = plan_fine_tune(
+        path_dataset,
+        task_type,
+        pending_paths,
+        base_epochs=base_epochs,
+        min_epochs=settings.FINE_TUNE_MIN_EPOCHS,
+        replay_ratio=settings.FINE_TUNE_REPLAY_RATIO,
+        replay_min=settings.FINE_TUNE_REPLAY_MIN,
+        full_threshold=settings.FINE_TUNE_FULL_THRESHOLD,
+        manifest=manifest,
+    )
+    logger.info(
+        "Дообучение: новых %d из %d, в выборке %s, эпох %d",
+        plan.new,
+        plan.total,
+        "весь датасет" if plan.subset is None else len(plan.subset),
+        plan.epochs,
+    )
+    return plan
+
+
+def _train_or_retrain(model_type, split_func, folder, path_dataset, data_root, _p, task_type: str, manifest: DatasetManifest):
     train = False
     if not SyncOrm.select_model(folder):
         train = True
         _p("splitting")
-        data = DataSpliting(path_dataset)
+        data = DataSpliting(
+            path_dataset,
+            split_mode=settings.SPLIT_MODE,
+            balance_mode=settings.BALANCE_MODE,
+            manifest=manifest,
+        )
         split_func(data)
         _p("learning")
         model = Model(
@@ -90,11 +140,18 @@ def _train_or_retrain(model_type, split_func, folder, path_dataset, data_root, _
         model.train()
         _p("saving_model")
         SyncOrm.update_data(folder)
-    elif SyncOrm.select_data_not_trained(folder):
+    elif pending := SyncOrm.select_data_not_trained(folder):
         train = True
         path_model, version, _, imgsz, _ = SyncOrm.select_model(folder)
         _p("fine_tune_split")
-        data = DataSpliting(path_dataset)
+        plan = _plan_fine_tune(path_dataset, task_type, [row[0] for row in pending], manifest)
+        data = DataSpliting(
+            path_dataset,
+            subset=plan.subset,
+            split_mode=settings.SPLIT_MODE,
+            balance_mode=settings.BALANCE_MODE,
+            manifest=manifest,
+        )
         split_func(data)
         _p("fine_tuning")
         model = Model(
@@ -104,7 +161,7 @@ def _train_or_retrain(model_type, split_func, folder, path_dataset, data_root, _
             imgsz=imgsz,
             version=version,
         )
-        model.additional_train()
+        model.additional_train(epochs=plan.epochs)
         _p("fine_tune_saved")
     else:
         _p("nothing_to_train")
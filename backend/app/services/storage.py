@@ -1,14 +1,46 @@
+import hashlib
+import io
+import json
+import logging
 import os
+import queue
 import re
+import shutil
+import threading
+import time
+import uuid
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 
+import certifi
+import urllib3
 from minio import Minio
+from minio.error import S3Error, ServerError
 from backend.config import settings
+from backend.dataset.manifest import MANIFEST_NAME as DATASET_MANIFEST_NAME
+
+logger = logging.getLogger(__name__)
 
 
 _client: Minio | None = None
 
 
+def _http_client() -> urllib3.PoolManager:
+    """Пул соединений под STORAGE_TRANSFER_WORKERS потоков (у minio по умолчанию 10)."""
+    timeout = 300
+    return urllib3.PoolManager(
+        timeout=urllib3.Timeout(connect=timeout, read=timeout),
+        maxsize=max(10, 2 * settings.STORAGE_TRANSFER_WORKERS),
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+        retries=urllib3.Retry(
+            total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]
+        ),
+    )
+
+
 def get_minio_client() -> Minio:
     global _client
     if _client is None:
@@ -17,12 +49,235 @@ def get_minio_client() -> Minio:
             access_key=settings.MINIO_ACCESS_KEY,
             secret_key=settings.MINIO_SECRET_KEY,
             secure=settings.MINIO_SECURE,
+            http_client=_http_client(),
         )
     return _client
 
 
+@dataclass
+class TransferStats:
+    files: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    # Файлы, не изменившиеся с прошлой загрузки (по SyncManifest)
+    skipped: int = 0
+
+    def log(self, what: str) -> None:
+        seconds = max(self.seconds, 1e-6)
+        logger.info(
+            "%s: файлов %d, %.1f МБ за %.2f с (%.0f файлов/с, %.1f МБ/с), без изменений %d",
+            what,
+            self.files,
+            self.bytes / 2**20,
+            self.seconds,
+            self.files / seconds,
+            self.bytes / 2**20 / seconds,
+            self.skipped,
+        )
+
+
+def _file_state(path: str) -> tuple[int, int]:
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class SyncManifest:
+    """
+    Локальный учёт загруженного в MinIO по папке задачи (ML_DATA_PATH/.storage_sync/{folder_id}.json):
+    объекты — из какого файла, с каким размером, mtime и sha256 загружены; sha256 файлов
+    датасета (раскладка cas). Файл с прежними размером и mtime повторно не читается и
+    не загружается. Объекты в MinIO по манифесту не удаляются.
+
+    Одну папку могут одновременно учитывать загрузка архива и синхронизация после
+    обучения: save() перечитывает файл и дописывает только свои изменения.
+    """
+
+    def __init__(self, folder_id: str):
+        self.path = os.path.join(settings.ML_DATA_PATH, SYNC_MANIFEST_DIR, f"{folder_id}.json")
+        data = self._read()
+        self.objects: dict[str, dict] = data.get("objects", {})
+        self.hashes: dict[str, dict] = data.get("hashes", {})
+        self._changed_objects: set[str] = set()
+        self._changed_hashes: set[str] = set()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if data.get("version") == MANIFEST_VERSION else {}
+
+    def is_uploaded(self, bucket: str, key: str, path: str, state: tuple[int, int]) -> bool:
+        entry = self.objects.get(f"{bucket}/{key}")
+        return (
+            entry is not None
+            and entry["path"] == path
+            and (entry["size"], entry["mtime_ns"]) == state
+        )
+
+    def uploaded(
+        self, bucket: str, key: str, path: str, state: tuple[int, int], sha256: str
+    ) -> None:
+        size, mtime_ns = state
+        self._changed_objects.add(f"{bucket}/{key}")
+        self.objects[f"{bucket}/{key}"] = {
+            "path": path,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "sha256": sha256,
+        }
+        self.remember_sha256(path, state, sha256)
+
+    def cached_sha256(self, path: str, state: tuple[int, int]) -> str | None:
+        entry = self.hashes.get(path)
+        if entry and (entry["size"], entry["mtime_ns"]) == state:
+            return entry["sha256"]
+        return None
+
+    def remember_sha256(self, path: str, state: tuple[int, int], sha256: str) -> None:
+        size, mtime_ns = state
+        self._changed_hashes.add(path)
+        self.hashes[path] = {"size": size, "mtime_ns": mtime_ns, "sha256": sha256}
+
+    def save(self) -> None:
+        with _manifest_lock:
+            data = self._read()
+            objects = data.get("objects", {})
+            hashes = data.get("hashes", {})
+            objects.update({k: self.objects[k] for k in self._changed_objects})
+            hashes.update({k: self.hashes[k] for k in self._changed_hashes})
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": MANIFEST_VERSION, "objects": objects, "hashes": hashes}, f)
+            os.replace(tmp, self.path)
+        self.objects, self.hashes = objects, hashes
+        self._changed_objects.clear()
+        self._changed_hashes.clear()
+
+
+def _parallel_map(fn: Callable, items: Iterable) -> list:
+    """fn по items в пуле STORAGE_TRANSFER_WORKERS потоков; первая ошибка пробрасывается."""
+    items = list(items)
+    workers = min(settings.STORAGE_TRANSFER_WORKERS, len(items))
+    if workers <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="minio") as pool:
+        return list(pool.map(fn, items))
+
+
+class _HashingReader:
+    """Файл для put_object: sha256 считается по мере отправки, без отдельного чтения."""
+
+    def __init__(self, f):
+        self._f = f
+        self.digest = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._f.read(size)
+        self.digest.update(chunk)
+        return chunk
+
+
+# Коды S3, при которых повтор имеет смысл (перегрузка и временные сбои сервера)
+RETRYABLE_S3_CODES = {"SlowDown", "RequestTimeout", "InternalError", "ServiceUnavailable"}
+
+
+def _is_retryable(e: Exception) -> bool:
+    """Сеть и 5xx/SlowDown — повторяются; AccessDenied, NoSuchBucket и т.п. — нет."""
+    if isinstance(e, S3Error):
+        status = getattr(e.response, "status", None)
+        return e.code in RETRYABLE_S3_CODES or (status is not None and status >= 500)
+    if isinstance(e, ServerError):
+        return e.status_code >= 500
+    return True
+
+
+def _put_file(client: Minio, bucket: str, key: str, path: str) -> tuple[int, str]:
+    """Загрузка файла с повторами (сеть, 5xx MinIO); возвращает (размер, sha256)."""
+    size = os.path.getsize(path)
+    for attempt in range(settings.STORAGE_MAX_RETRIES + 1):
+        try:
+            with open(path, "rb") as f:
+                reader = _HashingReader(f)
+                client.put_object(
+                    bucket,
+                    key,
+                    reader,
+                    size,
+                    part_size=settings.STORAGE_PART_SIZE_MB * 2**20,
+                )
+            return size, reader.digest.hexdigest()
+        except (S3Error, ServerError, urllib3.exceptions.HTTPError, ConnectionError) as e:
+            if attempt == settings.STORAGE_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = 0.5 * 2**attempt
+            logger.warning("Загрузка %s/%s: %s, повтор через %.1f с", bucket, key, e, delay)
+            time.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+def upload_files(
+    client: Minio,
+    bucket: str,
+    items: list[tuple[str, str]],
+    what: str,
+    sync: SyncManifest | None = None,
+) -> TransferStats:
+    """
+    Параллельно загрузить [(ключ объекта, локальный путь)] в bucket.
+    С sync — только файлы, изменившиеся с прошлой загрузки под тем же ключом.
+    """
+    started = time.perf_counter()
+    states = {path: _file_state(path) for _, path in items}
+    pending = items
+    if sync is not None:
+        pending = [
+            (key, path)
+            for key, path in items
+            if not sync.is_uploaded(bucket, key, path, states[path])
+        ]
+    results = _parallel_map(lambda item: _put_file(client, bucket, *item), pending)
+    if sync is not None:
+        for (key, path), (_, sha256) in zip(pending, results):
+            sync.uploaded(bucket, key, path, states[path], sha256)
+    stats = TransferStats(
+        len(pending),
+        sum(size for size, _ in results),
+        time.perf_counter() - started,
+        skipped=len(items) - len(pending),
+    )
+    if items:
+        stats.log(what)
+    return stats
+
+
 BUCKETS = ("datasets", "models", "results")
 
+# Раскладка датасетов в бакете datasets (DATASET_LAYOUT):
+#   cas  — blobs/<sha[:2]>/<sha> по содержимому + manifests/{folder_id}.json (путь → sha256);
+#   pack — файлы дописываются в шарды packs/{folder_id}/<id>.pack (~PACK_SHARD_MB),
+#          в манифесте у пути ещё шард и смещение (pack, offset);
+#   flat — datasets/{folder_id}/<относительный путь> (прежняя раскладка, читается всегда).
+DATASETS_BUCKET = "datasets"
+MANIFEST_VERSION = 1
+# Каталог локальных SyncManifest в ML_DATA_PATH (вне каталогов задач, которые загружаются)
+SYNC_MANIFEST_DIR = ".storage_sync"
+# pack: разрыв между нужными файлами шарда, который дешевле прочитать, чем сделать новый GET
+PACK_RANGE_GAP = 1 << 20
+
+# Перечитать-дописать-сохранить манифестов (SyncManifest, манифест датасета) в backend:
+# загрузка архива и синхронизация после обучения одной папки могут идти одновременно
+_manifest_lock = threading.Lock()
+# cas: новое содержимое не закрытых DatasetUploader → {"users": id загрузчиков,
+# "created": blob загружен одним из них, "committed": попал в манифест}. abort() удаляет
+# blob, только если его загрузили, на него больше никто не ссылается и ни один close()
+# его не закрепил; удаление идёт под блокировкой, чтобы никто не сослался на blob
+# между проверкой и удалением.
+_staged_blobs: dict[str, dict] = {}
+_staged_lock = threading.Lock()
+
 
 def ensure_buckets() -> None:
     client = get_minio_client()
@@ -110,35 +365,44 @@ def resolve_model_weights_for_download(folder_id: str, db_version: int) -> tuple
     )
 
 
-def _fput_tree(client: Minio, local_path: str, minio_prefix: str, bucket: str) -> None:
+def _fput_tree(
+    client: Minio,
+    local_path: str,
+    minio_prefix: str,
+    bucket: str,
+    sync: SyncManifest | None = None,
+) -> None:
     """Загрузить файл или каталог в bucket с префиксом (как раньше в pipeline)."""
     if os.path.isfile(local_path):
         name = os.path.basename(local_path)
-        client.fput_object(bucket, f"{minio_prefix}/{name}", local_path)
+        upload_files(client, bucket, [(f"{minio_prefix}/{name}", local_path)], bucket, sync)
         return
     base = Path(local_path)
-    for f in base.rglob("*"):
-        if f.is_file():
-            rel = f.relative_to(base)
-            obj = f"{minio_prefix}/{rel.as_posix()}"
-            client.fput_object(bucket, obj, str(f))
+    items = [
+        (f"{minio_prefix}/{f.relative_to(base).as_posix()}", str(f))
+        for f in base.rglob("*")
+        if f.is_file()
+    ]
+    upload_files(client, bucket, items, f"{bucket}/{minio_prefix}", sync)
 
 
 def sync_task_artifacts_to_minio(task_folder: str, job_id: str) -> None:
     """
     После обучения: залить results/ и models/ в MinIO.
     Вызывается только из backend (тот же том ML_DATA_PATH, что и у worker).
+    Загружаются только новые и изменённые файлы (SyncManifest папки задачи).
     """
     task_folder = os.path.abspath(task_folder)
     job_root = os.path.dirname(task_folder)
     folder_id = job_id
     ensure_buckets()
     client = get_minio_client()
+    sync = SyncManifest(folder_id)
 
     results_path = os.path.join(task_folder, "results")
     if os.path.isdir(results_path):
         prefix = task_folder.replace("/data/", "").replace(os.sep, "_")
-        _fput_tree(client, results_path, prefix, "results")
+        _fput_tree(client, results_path, prefix, "results", sync)
 
     # Веса: cwd при обучении — родитель task_dir; YOLO пишет в models/{folder_id}/.
     # Если dataset в подпапке, каталог models может быть только под task_folder.
@@ -148,40 +412,545 @@ def sync_task_artifacts_to_minio(task_folder: str, job_id: str) -> None:
     ):
         ap = os.path.abspath(models_path)
         if os.path.isdir(ap):
-            _fput_tree(client, ap, f"models_{folder_id}", "models")
+            _fput_tree(client, ap, f"models_{folder_id}", "models", sync)
+    sync.save()
 
     # Актуальный снимок задачи (в т.ч. новые файлы после дообучения)
     if os.path.isdir(task_folder):
-        for f in Path(task_folder).rglob("*"):
-            if f.is_file():
-                rel = f.relative_to(Path(task_folder))
-                obj = f"datasets/{folder_id}/{rel.as_posix()}"
-                client.fput_object("datasets", obj, str(f))
+        upload_dataset_tree(task_folder, folder_id, sync)
 
 
-def restore_dataset_tree_from_minio(folder_id: str, dest_folder: str) -> bool:
-    """Скачать datasets/{folder_id}/** в dest_folder. True если что-то скачано."""
-    ensure_buckets()
+def _blob_key(sha256: str) -> str:
+    return f"blobs/{sha256[:2]}/{sha256}"
+
+
+def _manifest_key(folder_id: str) -> str:
+    return f"manifests/{folder_id}.json"
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _object_exists(client: Minio, bucket: str, key: str) -> bool:
+    try:
+        client.stat_object(bucket, key)
+        return True
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchObject", "NotFound"):
+            return False
+        raise
+
+
+def load_dataset_manifest(folder_id: str) -> dict[str, dict] | None:
+    """Манифест датасета {относительный путь: {"sha256", "size"}}; None — нет (раскладка flat)."""
     client = get_minio_client()
+    try:
+        response = client.get_object(DATASETS_BUCKET, _manifest_key(folder_id))
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchObject", "NotFound"):
+            return None
+        raise
+    try:
+        return json.loads(response.read()).get("files", {})
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def _update_dataset_manifest(client: Minio, folder_id: str, changes: dict[str, dict]) -> None:
+    """Дописать changes в манифест датасета, перечитав его (последний писатель не затирает чужое)."""
+    with _manifest_lock:
+        files = load_dataset_manifest(folder_id) or {}
+        files.update(changes)
+        body = json.dumps(
+            {"version": MANIFEST_VERSION, "files": dict(sorted(files.items()))}, ensure_ascii=False
+        ).encode()
+        client.put_object(
+            DATASETS_BUCKET,
+            _manifest_key(folder_id),
+            io.BytesIO(body),
+            len(body),
+            content_type="application/json",
+        )
+
+
+def _remove_objects(client: Minio, keys: list[str]) -> None:
+    """Удалить объекты датасетов (ошибки только в лог: очистка не должна скрыть причину)."""
+    def remove(key: str) -> None:
+        try:
+            client.remove_object(DATASETS_BUCKET, key)
+        except (S3Error, ServerError, urllib3.exceptions.HTTPError, ConnectionError) as e:
+            logger.warning("Не удалось удалить %s/%s: %s", DATASETS_BUCKET, key, e)
+
+    _parallel_map(remove, keys)
+
+
+class _PackShard:
+    """
+    Локальный шард раскладки pack: место резервируется под блокировкой загрузчика
+    (reserve), файлы пишутся по своим смещениям параллельно (write). full — шард
+    отцеплен от загрузчика; его загружает последний завершивший запись поток.
+    """
+
+    def __init__(self, key: str, path: str):
+        self.key = key
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        self.size = 0
+        self.writers = 0
+        self.full = False
+
+    def reserve(self, size: int) -> int:
+        offset = self.size
+        self.size += size
+        self.writers += 1
+        return offset
+
+    def write(self, path: str, offset: int, size: int) -> None:
+        with open(path, "rb") as src:
+            remaining = size
+            while remaining:
+                chunk = src.read(min(remaining, 1 << 20))
+                if not chunk:
+                    raise IOError(f"{path}: файл короче {size} байт")
+                os.pwrite(self._fd, chunk, offset)
+                offset += len(chunk)
+                remaining -= len(chunk)
+
+    def release(self) -> bool:
+        """Запись завершена; True — шард заполнен и больше никто в него не пишет."""
+        self.writers -= 1
+        return self.full and self.writers == 0
+
+    def detach(self) -> tuple[str, str]:
+        os.close(self._fd)
+        return self.key, self.path
+
+
+class DatasetUploader:
+    """
+    Загрузка файлов датасета folder_id по мере их появления на диске (распаковка архива
+    идёт параллельно с загрузкой).
+
+    add() ставит файл в ограниченную очередь (STORAGE_UPLOAD_QUEUE) и ждёт, если она
+    заполнена; пул из STORAGE_TRANSFER_WORKERS потоков загружает файлы. cas: blob
+    загружается, только если такого содержимого ещё нет в бакете (в том числе от других
+    задач), манифест дополняется добавленными путями — прежние пути в нём остаются.
+    pack: новое содержимое дописывается в локальный шард, заполненный шард загружается
+    одним объектом; манифест — как у cas, с шардом и смещением. flat: каждый файл под
+    datasets/{folder_id}/. Файлы, не изменившиеся с прошлой загрузки (SyncManifest),
+    не перечитываются. close() дожидается загрузки и дописывает изменённые пути в
+    манифесты; abort() отбрасывает очередь без сохранения и удаляет объекты, созданные
+    этим загрузчиком (новые flat-объекты, шарды, новые blob без других ссылок).
+    """
+
+    def __init__(self, local_root: str, folder_id: str, sync: SyncManifest | None = None):
+        ensure_buckets()
+        self.local_root = os.path.abspath(local_root)
+        self.folder_id = folder_id
+        layout = settings.DATASET_LAYOUT
+        self.layout = layout if layout in ("cas", "pack") else "flat"
+        self._client = get_minio_client()
+        self._sync = sync or SyncManifest(folder_id)
+        self._manifest = (
+            (load_dataset_manifest(folder_id) or {}) if self.layout != "flat" else {}
+        )
+        # cas: содержимое, которое уже есть в бакете или взято в загрузку другим потоком
+        self._claimed = {e["sha256"] for e in self._manifest.values() if "pack" not in e}
+        # pack: sha256 → место в шарде ({"pack", "offset", "size"})
+        self._packed = {
+            e["sha256"]: {"pack": e["pack"], "offset": e["offset"], "size": e["size"]}
+            for e in self._manifest.values()
+            if "pack" in e
+        }
+        self._pack_lock = threading.Lock()
+        self._shard: _PackShard | None = None
+        self._lock = threading.Lock()
+        self._error: BaseException | None = None
+        self._aborted = False
+        # Изменённые пути манифеста, созданные объекты (flat, шарды), новые blob cas
+        self._changed: set[str] = set()
+        self._created: list[str] = []
+        self._staged: set[str] = set()
+        self.files = 0
+        self.hashed = 0
+        self.stats = TransferStats()
+        self._started = time.perf_counter()
+        self._queue: queue.Queue = queue.Queue(maxsize=settings.STORAGE_UPLOAD_QUEUE)
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"minio-upload-{i}", daemon=True)
+            for i in range(max(1, settings.STORAGE_TRANSFER_WORKERS))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def add(self, path: str) -> None:
+        """Поставить файл в очередь загрузки (ждёт, пока в очереди есть место)."""
+        self._queue.put(os.path.abspath(path))
+
+    def close(self) -> TransferStats:
+        """Дождаться загрузки, сохранить манифесты; ошибка загрузки пробрасывается."""
+        self._stop()
+        if self._error is None and self._shard is not None:
+            try:
+                self._upload_shard(*self._detach_shard())
+            except BaseException as e:
+                self._error = e
+        self._release_staged()
+        if self._error is not None:
+            self._discard_shard()
+            raise self._error
+        if self.layout != "flat":
+            _update_dataset_manifest(
+                self._client,
+                self.folder_id,
+                {rel: self._manifest[rel] for rel in self._changed},
+            )
+        self._sync.save()
+        self.stats.seconds = time.perf_counter() - self._started
+        self.stats.log(f"Датасет {self.folder_id}")
+        logger.info(
+            "Датасет %s: файлов %d, перечитано %d", self.folder_id, self.files, self.hashed
+        )
+        return self.stats
+
+    def abort(self) -> None:
+        """
+        Остановить загрузку: файлы из очереди отбрасываются, манифесты не сохраняются,
+        уже загруженные этим загрузчиком объекты удаляются.
+        """
+        self._aborted = True
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._stop()
+        self._discard_shard()
+        with _staged_lock:
+            blobs = [
+                _blob_key(sha256)
+                for sha256, staged in self._leave_staged(commit=False)
+                if staged["created"] and not staged["committed"]
+            ]
+            _remove_objects(self._client, blobs)
+        _remove_objects(self._client, self._created)
+        removed = len(blobs) + len(self._created)
+        if removed:
+            logger.info("Датасет %s: загрузка отменена, удалено объектов %d", self.folder_id, removed)
+
+    def _release_staged(self) -> None:
+        """Новые blob переходят в манифест: abort() других загрузчиков их не удалит."""
+        with _staged_lock:
+            self._leave_staged(commit=True)
+
+    def _leave_staged(self, commit: bool) -> list[tuple[str, dict]]:
+        """Снять ссылки загрузчика (под _staged_lock); возвращает blob, на которые больше никто не ссылается."""
+        released = []
+        for sha256 in self._staged:
+            staged = _staged_blobs[sha256]
+            staged["committed"] = staged["committed"] or commit
+            staged["users"].discard(id(self))
+            if not staged["users"]:
+                del _staged_blobs[sha256]
+                released.append((sha256, staged))
+        self._staged.clear()
+        return released
+
+    def _stop(self) -> None:
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _worker(self) -> None:
+        while True:
+            path = self._queue.get()
+            if path is None:
+                return
+            if self._aborted or self._error is not None:
+                continue
+            try:
+                self._upload(path)
+            except BaseException as e:
+                with self._lock:
+                    self._error = self._error or e
+
+    def _upload(self, path: str) -> None:
+        rel = Path(path).relative_to(self.local_root).as_posix()
+        state = _file_state(path)
+        if self.layout == "flat":
+            key = f"datasets/{self.folder_id}/{rel}"
+            if self._sync.is_uploaded(DATASETS_BUCKET, key, path, state):
+                self._count(skipped=1)
+                return
+            existed = f"{DATASETS_BUCKET}/{key}" in self._sync.objects
+            size, sha256 = _put_file(self._client, DATASETS_BUCKET, key, path)
+            with self._lock:
+                if not existed:
+                    self._created.append(key)
+                self._sync.uploaded(DATASETS_BUCKET, key, path, state, sha256)
+            self._count(files=1, bytes=size)
+            return
+
+        sha256 = self._sync.cached_sha256(path, state)
+        if sha256 is None:
+            sha256 = _file_sha256(path)
+            with self._lock:
+                self.hashed += 1
+                self._sync.remember_sha256(path, state, sha256)
+        if self.layout == "pack":
+            entry, appended = self._append_to_pack(path, sha256, state[0])
+            with self._lock:
+                self._manifest[rel] = {"sha256": sha256, **entry}
+                self._changed.add(rel)
+            self._count(skipped=0 if appended else 1)
+            return
+        with self._lock:
+            self._manifest[rel] = {"sha256": sha256, "size": state[0]}
+            self._changed.add(rel)
+            # Один путь на новое содержимое: дубликаты внутри датасета грузятся один раз
+            new = sha256 not in self._claimed
+            self._claimed.add(sha256)
+        key = _blob_key(sha256)
+        if new:
+            # Ссылка до проверки: abort() другого загрузчика не удалит blob, на который
+            # этот загрузчик уже опирается
+            with _staged_lock:
+                staged = _staged_blobs.setdefault(
+                    sha256, {"users": set(), "created": False, "committed": False}
+                )
+                staged["users"].add(id(self))
+                self._staged.add(sha256)
+            if not _object_exists(self._client, DATASETS_BUCKET, key):
+                size, _ = _put_file(self._client, DATASETS_BUCKET, key, path)
+                with _staged_lock:
+                    staged["created"] = True
+                self._count(files=1, bytes=size)
+                return
+        self._count(skipped=1)
+
+    def _count(self, files: int = 0, bytes: int = 0, skipped: int = 0) -> None:
+        with self._lock:
+            self.files += 1
+            self.stats.files += files
+            self.stats.bytes += bytes
+            self.stats.skipped += skipped
+
+    def _append_to_pack(self, path: str, sha256: str, size: int) -> tuple[dict, bool]:
+        """
+        Дописать файл в текущий шард (если такого содержимого ещё нет); заполненный шард
+        загружается. Под блокировкой только резервируется место, копирование идёт
+        параллельно (pwrite по своему смещению); шард загружает поток, дописавший в него
+        последним. Возвращает (место в шарде, дописан ли файл).
+        """
+        with self._pack_lock:
+            entry = self._packed.get(sha256)
+            if entry is not None:
+                return entry, False
+            if self._shard is None:
+                shard_id = uuid.uuid4().hex
+                self._shard = _PackShard(
+                    f"packs/{self.folder_id}/{shard_id}.pack",
+                    os.path.join(settings.ML_DATA_PATH, SYNC_MANIFEST_DIR, "packs", f"{shard_id}.pack"),
+                )
+            shard = self._shard
+            offset = shard.reserve(size)
+            entry = {"pack": shard.key, "offset": offset, "size": size}
+            self._packed[sha256] = entry
+            if shard.size >= settings.PACK_SHARD_MB * 2**20:
+                self._shard = None
+                shard.full = True
+        written = False
+        try:
+            shard.write(path, offset, size)
+            written = True
+        finally:
+            with self._pack_lock:
+                ready = shard.release()
+            if ready and written and not self._aborted and self._error is None:
+                self._upload_shard(*shard.detach())
+            elif ready:
+                os.remove(shard.detach()[1])
+        return entry, True
+
+    def _detach_shard(self) -> tuple[str, str]:
+        shard, self._shard = self._shard, None
+        return shard.detach()
+
+    def _upload_shard(self, key: str, path: str) -> None:
+        try:
+            size, _ = _put_file(self._client, DATASETS_BUCKET, key, path)
+        finally:
+            os.remove(path)
+        with self._lock:
+            self._created.append(key)
+            self.stats.files += 1
+            self.stats.bytes += size
+
+    def _discard_shard(self) -> None:
+        if self._shard is not None:
+            os.remove(self._detach_shard()[1])
+
+
+def upload_dataset_tree(
+    local_root: str, folder_id: str, sync: SyncManifest | None = None
+) -> TransferStats:
+    """
+    Загрузить все файлы local_root как датасет folder_id (см. DatasetUploader).
+    Манифест каталога, оставшийся в корне от прежних версий, не загружается.
+    """
+    uploader = DatasetUploader(local_root, folder_id, sync)
+    root_manifest = Path(local_root) / DATASET_MANIFEST_NAME
+    try:
+        for f in Path(local_root).rglob("*"):
+            if f.is_file() and f != root_manifest:
+                uploader.add(str(f))
+    except BaseException:
+        uploader.abort()
+        raise
+    return uploader.close()
+
+
+def _copy_exact(src, out, size: int) -> None:
+    """Прочитать ровно size байт из src в out (None — пропустить)."""
+    remaining = size
+    while remaining:
+        chunk = src.read(min(remaining, 1 << 20))
+        if not chunk:
+            raise IOError(f"Обрыв чтения шарда: не хватает {remaining} байт")
+        if out is not None:
+            out.write(chunk)
+        remaining -= len(chunk)
+
+
+def _get_range(
+    client: Minio, key: str, start: int, length: int, members: list[tuple[int, int, str]]
+) -> None:
+    """Один ranged GET [start, start + length) шарда key, члены пишутся по своим путям."""
+    response = client.get_object(DATASETS_BUCKET, key, offset=start, length=length)
+    try:
+        position = start
+        for offset, size, dest in members:
+            _copy_exact(response, None, offset - position)
+            with open(dest, "wb") as out:
+                _copy_exact(response, out, size)
+            position = offset + size
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def _restore_pack(client: Minio, key: str, members: list[tuple[int, int, str]]) -> None:
+    """
+    Члены шарда [(смещение, размер, путь)]: соседние члены, между которыми не больше
+    PACK_RANGE_GAP байт (заменённые при дообучении файлы), читаются одним ranged GET.
+    """
+    members = sorted(members)
+    # Пустые файлы не читаются: диапазон нулевой длины в конце шарда MinIO отклоняет (416)
+    for _, size, dest in members:
+        if size == 0:
+            open(dest, "wb").close()
+    members = [member for member in members if member[1] > 0]
+    if not members:
+        return
+    run = [members[0]]
+    for member in members[1:]:
+        offset, size, _ = run[-1]
+        if member[0] - (offset + size) > PACK_RANGE_GAP:
+            _get_range(client, key, run[0][0], offset + size - run[0][0], run)
+            run = []
+        run.append(member)
+    offset, size, _ = run[-1]
+    _get_range(client, key, run[0][0], offset + size - run[0][0], run)
+
+
+def _restore_from_manifest(client: Minio, manifest: dict[str, dict], dest_abs: str) -> int:
+    """
+    Скачать каждое содержимое один раз: cas — blob (параллельно), pack — диапазоны
+    шардов (параллельно по шардам); одинаковые файлы копируются локально.
+    """
+    started = time.perf_counter()
+    primary: dict[str, tuple[str, dict]] = {}
+    copies: list[tuple[str, str]] = []
+    for rel, entry in sorted(manifest.items()):
+        dest = os.path.normpath(os.path.join(dest_abs, rel))
+        if not dest.startswith(dest_abs + os.sep):
+            continue
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        sha256 = entry["sha256"]
+        if sha256 in primary:
+            copies.append((dest, sha256))
+        else:
+            primary[sha256] = (dest, entry)
+
+    blobs = [(dest, sha256) for sha256, (dest, entry) in primary.items() if "pack" not in entry]
+    packs: dict[str, list[tuple[int, int, str]]] = {}
+    for dest, entry in primary.values():
+        if "pack" in entry:
+            packs.setdefault(entry["pack"], []).append((entry["offset"], entry["size"], dest))
+    _parallel_map(
+        lambda item: client.fget_object(DATASETS_BUCKET, _blob_key(item[1]), item[0]), blobs
+    )
+    _parallel_map(lambda item: _restore_pack(client, *item), packs.items())
+    for dest, sha256 in copies:
+        shutil.copyfile(primary[sha256][0], dest)
+
+    n = len(primary) + len(copies)
+    logger.info(
+        "Восстановлено файлов %d (объектов: blob %d, шардов %d) за %.2f с",
+        n,
+        len(blobs),
+        len(packs),
+        time.perf_counter() - started,
+    )
+    return n
+
+
+def _restore_flat(client: Minio, folder_id: str, dest_abs: str, skip: Iterable[str] = ()) -> int:
+    """Скачать datasets/{folder_id}/** (flat), кроме относительных путей из skip."""
+    skip = set(skip)
     prefix = f"datasets/{folder_id}/"
-    dest_abs = os.path.abspath(dest_folder)
-    os.makedirs(dest_abs, exist_ok=True)
-    n = 0
-    for obj in client.list_objects("datasets", prefix=prefix, recursive=True):
+    items = []
+    for obj in client.list_objects(DATASETS_BUCKET, prefix=prefix, recursive=True):
         if getattr(obj, "is_dir", False):
             continue
         key = obj.object_name
         if not key.startswith(prefix):
             continue
         rel = key[len(prefix) :]
-        if not rel or rel.endswith("/"):
+        if not rel or rel.endswith("/") or rel in skip:
+            continue
+        dest = os.path.normpath(os.path.join(dest_abs, rel))
+        if not dest.startswith(dest_abs + os.sep):
             continue
-        dest = os.path.join(dest_abs, rel)
-        parent = os.path.dirname(dest)
-        if parent:
-            os.makedirs(parent, exist_ok=True)
-        client.fget_object("datasets", key, dest)
-        n += 1
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        items.append((key, dest))
+    _parallel_map(lambda item: client.fget_object(DATASETS_BUCKET, *item), items)
+    return len(items)
+
+
+def restore_dataset_tree_from_minio(folder_id: str, dest_folder: str) -> bool:
+    """
+    Восстановить датасет folder_id в dest_folder: по манифесту (cas, pack) и из
+    datasets/{folder_id}/** (flat). Папка, сохранённая до cas/pack, после дообучения
+    имеет манифест только с новыми файлами, поэтому flat-объекты дополняют его;
+    при совпадении путей побеждает манифест (он новее). True если что-то скачано.
+    """
+    ensure_buckets()
+    client = get_minio_client()
+    dest_abs = os.path.abspath(dest_folder)
+    os.makedirs(dest_abs, exist_ok=True)
+    manifest = load_dataset_manifest(folder_id) or {}
+    n = _restore_flat(client, folder_id, dest_abs, skip=manifest)
+    if manifest:
+        n += _restore_from_manifest(client, manifest, dest_abs)
     return n > 0
 
 
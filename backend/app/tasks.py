@@ -1,15 +1,18 @@
 import json
+import logging
 import os
 import shutil
 import urllib.error
 import urllib.request
-import zipfile
 from collections import deque
 from pathlib import Path
 
 from celery import Celery
+from celery.signals import celeryd_after_setup, worker_process_init
 from backend.config import settings
 
+logger = logging.getLogger(__name__)
+
 celery_app = Celery(
     "automl",
     broker=settings.celery_broker,
@@ -21,6 +24,45 @@ celery_app.conf.update(
     result_serializer="json",
 )
 
+# Процессов в пуле worker (--concurrency, worker_concurrency или по числу ядер);
+# запоминается в главном процессе до запуска дочерних и наследуется ими
+_pool_size: int | None = None
+
+
+@celeryd_after_setup.connect
+def _remember_pool_size(sender=None, instance=None, **_kwargs) -> None:
+    global _pool_size
+    _pool_size = getattr(instance, "concurrency", None)
+
+
+def _worker_pool_size() -> int:
+    return _pool_size or celery_app.conf.worker_concurrency or os.cpu_count() or 1
+
+
+@worker_process_init.connect
+def _init_worker_process(**_kwargs) -> None:
+    """
+    Профиль ресурсов worker (batch, dataloader workers, потоки torch — из доли
+    ядер и памяти на процесс пула) и предзагрузка недавно использованных моделей
+    (MODEL_CACHE_PRELOAD > 0).
+    """
+    try:
+        from ml.resources import get_profile
+
+        get_profile(_worker_pool_size()).apply()
+    except Exception as e:
+        logger.warning("Не удалось определить профиль ресурсов: %s", e)
+
+    preload = int(os.environ.get("MODEL_CACHE_PRELOAD", "0") or 0)
+    if preload <= 0:
+        return
+    try:
+        from ml.registry import get_registry
+
+        get_registry().preload(preload)
+    except Exception as e:
+        logger.warning("Предзагрузка моделей не удалась: %s", e)
+
 
 def _notify_backend_storage_sync(job_id: str, task_folder: str) -> None:
     """Синхронизация артефактов: worker → backend → MinIO."""
@@ -135,6 +177,9 @@ def infer_task(
 ):
     from backend.db.orm import SyncOrm
     from ml.model import Model
+    from ml.result_sink import ZipSink
+    from backend.app.services.archive import extract_archive
+    from backend.integrations.google_drive_upload import DriveUploader, drive_upload_enabled
     steps_history: list[str] = []
 
     def report(step_id: str) -> None:
@@ -172,22 +217,11 @@ def infer_task(
     raw = os.path.join(work, "raw")
     os.makedirs(raw, exist_ok=True)
     try:
-        with zipfile.ZipFile(zip_path, "r") as zf:
-            for m in zf.infolist():
-                if m.is_dir():
-                    continue
-                target = os.path.normpath(os.path.join(raw, m.filename))
-                if not (target == raw or target.startswith(raw + os.sep)):
-                    raise ValueError("zip slip")
-                parent = os.path.dirname(target)
-                if parent:
-                    os.makedirs(parent, exist_ok=True)
-                with zf.open(m, "r") as src, open(target, "wb") as out:
-                    shutil.copyfileobj(src, out)
+        extract_archive(zip_path, raw)
 
         test_dir = _find_folder_with_images(raw)
         if not os.listdir(test_dir):
-            raise RuntimeError("No images in ZIP")
+            raise RuntimeError("No images in archive")
 
         report("infer_running")
         model = Model(
@@ -197,22 +231,29 @@ def infer_task(
             imgsz=imgsz,
             version=version,
         )
-        model.predict(task_type)
-
-        path_result = model.path_result
-        if not os.path.isdir(path_result) or not os.listdir(path_result):
-            raise RuntimeError("Inference produced no results")
-
-        report("infer_pack")
-        out_zip_base = os.path.join(
-            data_path, folder_id, "inference_artifacts", inference_id
+        out_zip = os.path.join(
+            data_path, folder_id, "inference_artifacts", f"{inference_id}.zip"
         )
-        os.makedirs(os.path.dirname(out_zip_base), exist_ok=True)
-        shutil.make_archive(out_zip_base, "zip", path_result)
-        out_zip = out_zip_base + ".zip"
+        os.makedirs(os.path.dirname(out_zip), exist_ok=True)
+        # Артефакты пишутся прямо в архив результатов, без промежуточного results/.
+        # Копии в Drive уходят в фоне и дозагружаются после выгрузки архива.
+        uploader = DriveUploader() if drive_upload_enabled() else None
+        try:
+            sink = ZipSink(out_zip)
+            try:
+                model.predict(task_type, sink=sink, uploader=uploader)
+                report("infer_pack")
+            finally:
+                sink.close()
+            if not sink.count:
+                os.remove(out_zip)
+                raise RuntimeError("Inference produced no results")
 
-        report("infer_upload")
-        _notify_backend_inference_upload(folder_id, inference_id, out_zip)
+            report("infer_upload")
+            _notify_backend_inference_upload(folder_id, inference_id, out_zip)
+        finally:
+            if uploader is not None:
+                uploader.close()
 
         if os.path.exists(out_zip):
             os.remove(out_zip)
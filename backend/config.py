@@ -17,12 +17,56 @@ class Settings(BaseSettings):
     MINIO_SECRET_KEY: str = "minioadmin"
     MINIO_SECURE: bool = False
 
+    # Раскладка датасетов в MinIO: cas (по содержимому + манифест), pack (шарды + смещения
+    # в манифесте) или flat
+    DATASET_LAYOUT: str = "cas"
+    # pack: размер шарда, МБ
+    PACK_SHARD_MB: int = 256
+    # Загрузка в MinIO: потоков, размер части multipart (МБ, не меньше 5), повторов на файл
+    STORAGE_TRANSFER_WORKERS: int = 16
+    STORAGE_PART_SIZE_MB: int = 16
+    STORAGE_MAX_RETRIES: int = 3
+    # Очередь файлов, ждущих загрузки при распаковке архива (ограничивает опережение)
+    STORAGE_UPLOAD_QUEUE: int = 1024
+
+    # Загрузка архивов в API: максимальный размер (0 — без ограничения) и блок записи на диск
+    UPLOAD_MAX_BYTES: int = 5 * 2**30
+    UPLOAD_CHUNK_BYTES: int = 2**20
+
     INTERNAL_STORAGE_TOKEN: str = ""
+    # TTL кэша метаданных моделей и датасетов в backend, секунды (0 — без кэша)
+    METADATA_CACHE_TTL: float = 5.0
 
     ML_DATA_PATH: str = "/data"
 
+    # Обучение в ml worker: None — из профиля ресурсов (ml/resources.py)
+    TRAIN_BATCH: int | None = None
+    TRAIN_WORKERS: int | None = None
+    TRAIN_THREADS: int | None = None
+    TRAIN_EPOCHS: int = 1
+    FINE_TUNE_EPOCHS: int = 10
+    TRAIN_MEMORY_PER_IMAGE_MB: float = 600.0
+    # Дообучение: incremental — новые файлы и повторная выборка обученных, full — весь датасет
+    FINE_TUNE_MODE: str = "incremental"
+    FINE_TUNE_MIN_EPOCHS: int = 3
+    FINE_TUNE_REPLAY_RATIO: float = 1.0
+    FINE_TUNE_REPLAY_MIN: int = 10
+    FINE_TUNE_FULL_THRESHOLD: float = 0.5
+    # Разбиение в data_root: copy, link (hardlink/reflink, иначе копия) или list (train.txt/val.txt)
+    SPLIT_MODE: str = "copy"
+    # Балансировка классов классификации: materialize — аугментированные копии в train,
+    # weighted — веса классов в sampling.json и взвешенная выборка при обучении
+    BALANCE_MODE: str = "materialize"
+
     SERVICE_ACCOUNT_FILE: str = "automl_token.json"
     DRIVE_FOLDER_ID: str = ""
+    # Загрузка результатов инференса в Drive (ml worker)
+    DRIVE_UPLOAD_WORKERS: int = 4
+    DRIVE_UPLOAD_QUEUE: int = 256
+    # Каталог для файлов, не поместившихся в очередь (пусто — системный временный)
+    DRIVE_UPLOAD_SPILL_DIR: str = ""
+    # Адрес API Drive вместо www.googleapis.com (локальный или фейковый Drive)
+    DRIVE_API_ENDPOINT: str = ""
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
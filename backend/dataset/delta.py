@@ -0,0 +1,93 @@
+"""
+План инкрементального дообучения: новые (не обученные) изображения плюс
+ограниченная повторная выборка уже обученных, число эпох по размеру изменений.
+"""
+import math
+import os
+import random
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class FineTunePlan:
+    """
+    Атрибуты:
+        subset (set | None): относительные пути изображений в dataset/ для DataSpliting; None — весь датасет.
+        new (int): Число новых изображений.
+        total (int): Число изображений в датасете.
+        epochs (int): Эпохи дообучения.
+    """
+
+    subset: set[str] | None
+    new: int
+    total: int
+    epochs: int
+
+
+def _units(path_dataset: str, task_type: str, listdir=os.listdir) -> dict[str, tuple[str, ...]]:
+    """
+    Единицы выборки: относительный путь изображения → абсолютные пути файлов,
+    изменение которых делает единицу новой (для сегментации — изображение и разметка).
+    Для классификации ключ группы — класс (первый компонент пути).
+    """
+    units = {}
+    if task_type == "сегментация":
+        label_dir = os.path.join(path_dataset, "labels")
+        image_dir = os.path.join(path_dataset, "images")
+        for name in listdir(image_dir):
+            label = os.path.join(label_dir, os.path.splitext(name)[0] + ".txt")
+            units[f"images/{name}"] = (os.path.join(image_dir, name), label)
+    else:
+        for class_name in listdir(path_dataset):
+            class_dir = os.path.join(path_dataset, class_name)
+            for name in listdir(class_dir):
+                units[f"{class_name}/{name}"] = (os.path.join(class_dir, name),)
+    return units
+
+
+def plan_fine_tune(
+    path_dataset: str,
+    task_type: str,
+    pending_paths: list[str],
+    base_epochs: int,
+    min_epochs: int,
+    replay_ratio: float,
+    replay_min: int,
+    full_threshold: float,
+    seed: int = 42,
+    manifest=None,
+) -> FineTunePlan:
+    """
+    Параметры:
+        pending_paths (list): пути файлов, ещё не помеченных как обученные (SyncOrm.select_data_not_trained).
+        base_epochs (int): эпохи полного дообучения.
+        min_epochs (int): минимум эпох инкрементального дообучения.
+        replay_ratio (float): сколько обученных изображений повторить на одно новое.
+        replay_min (int): минимум повторяемых изображений (для классификации — на класс,
+            чтобы каждый класс попал в train и val).
+        full_threshold (float): доля новых изображений, начиная с которой дообучение идёт по всему датасету.
+        manifest (DatasetManifest, optional): манифест каталога задачи вместо os.listdir.
+    """
+    pending = {os.path.normpath(p) for p in pending_paths}
+    units = _units(path_dataset, task_type, manifest.listdir if manifest else os.listdir)
+    new = {rel for rel, files in units.items() if any(os.path.normpath(f) in pending for f in files)}
+    total = len(units)
+    if not new or len(new) >= full_threshold * total:
+        return FineTunePlan(subset=None, new=len(new), total=total, epochs=base_epochs)
+
+    # Классификация: повторная выборка по классам, сегментация — одной группой
+    groups: dict[str, list[str]] = {}
+    for rel in sorted(units):
+        group = rel.split("/", 1)[0] if task_type != "сегментация" else ""
+        groups.setdefault(group, [])
+        if rel not in new:
+            groups[group].append(rel)
+    rng = random.Random(seed)
+    subset = set(new)
+    for group, trained in groups.items():
+        group_new = sum(1 for rel in new if group == "" or rel.startswith(f"{group}/"))
+        k = min(len(trained), max(replay_min, math.ceil(replay_ratio * group_new)))
+        subset.update(rng.sample(trained, k))
+
+    epochs = min(base_epochs, max(min_epochs, math.ceil(base_epochs * len(new) / total)))
+    return FineTunePlan(subset=subset, new=len(new), total=total, epochs=epochs)
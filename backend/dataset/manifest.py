@@ -0,0 +1,267 @@
+"""
+Манифест каталога задачи (папка с dataset/): один обход os.scandir вместо
+повторных os.listdir/os.walk в определении типа задачи, индексации,
+разбиении и генерации dataset.yaml.
+
+Манифест сохраняется в ML_DATA_PATH/.storage_sync/datasets/ (рядом с SyncManifest,
+вне каталога задачи — иначе внутренний кэш попал бы в MinIO вместе с артефактами)
+и переиспользуется, пока не изменились состав каталогов и файлов, размеры и mtime_ns
+файлов (проверка — один проход os.scandir без чтения содержимого: файл, переписанный
+на месте, например при распаковке архива дообучения, делает манифест устаревшим).
+
+Файлы dataset/, которые Ultralytics не читает (не изображения в images/ и папках
+классов, не .txt в labels/, файлы в корне dataset/ — .DS_Store, Thumbs.db, README),
+в манифест не входят и перечисляются в ignored: разбиение, определение типа задачи,
+индексация и проверка датасета видят один и тот же набор файлов.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Прежнее имя манифеста в каталоге задачи: в сохранённых ранее датасетах файл ещё
+# встречается и в состав каталога не входит
+MANIFEST_NAME = ".dataset_manifest.json"
+MANIFEST_VERSION = 2
+MANIFEST_DIR = os.path.join(".storage_sync", "datasets")
+DATASET_DIR = "dataset"
+# Расширения изображений, которые читает Ultralytics (кроме dng/pfm/heic — нужны плагины)
+IMAGE_EXTS = {".bmp", ".jpeg", ".jpg", ".mpo", ".png", ".tif", ".tiff", ".webp"}
+
+
+def manifest_path(root: str) -> str:
+    """Путь сохранённого манифеста каталога задачи root (абсолютный путь)."""
+    data_path = os.path.abspath(os.environ.get("ML_DATA_PATH", "/data"))
+    key = hashlib.sha1(root.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(data_path, MANIFEST_DIR, f"{os.path.basename(root)}-{key}.json")
+
+
+def _ignored(parts: list[str]) -> bool:
+    """Файл dataset/ (части относительного пути), который Ultralytics не читает."""
+    if len(parts) < 2 or parts[0] != DATASET_DIR:
+        return False
+    if len(parts) == 2:
+        return True
+    ext = os.path.splitext(parts[-1])[1].lower()
+    if parts[1] == "labels":
+        return ext != ".txt"
+    return ext not in IMAGE_EXTS
+
+
+def _walk(root: str):
+    """
+    Один проход os.scandir по root: (относительный путь каталога, DirEntry) для
+    каталогов и (относительный путь файла, DirEntry) для файлов; файл манифеста
+    прежних версий в корне пропускается. Порядок — по именам внутри каталога.
+    """
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        abs_dir = os.path.join(root, rel_dir) if rel_dir else root
+        with os.scandir(abs_dir) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        for entry in entries:
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(rel)
+                yield rel, entry
+            elif rel_dir or entry.name != MANIFEST_NAME:
+                yield rel, entry
+
+
+def _label_class_ids(path: str) -> tuple[list[int] | None, Counter]:
+    """
+    Классы файла разметки YOLO: первый токен каждой строки — целый id класса.
+    (None, ...) — если id не число.
+    """
+    counts: Counter = Counter()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.split(maxsplit=1)
+            if not parts:
+                continue
+            try:
+                counts[int(parts[0])] += 1
+            except ValueError:
+                return None, Counter()
+    return sorted(counts), counts
+
+
+class DatasetManifest:
+    """
+    Файлы каталога задачи.
+
+    Атрибуты:
+        root (str): Каталог задачи.
+        files (dict): относительный путь (posix) → {"size", "mtime_ns", "classes"};
+            classes — id классов файла разметки dataset/labels/*.txt, иначе None.
+        dirs (dict): относительный путь каталога → mtime_ns ('' — корень).
+        top (list): Имена верхнего уровня (без файла манифеста).
+        histogram (dict): Гистограмма классов dataset/: для сегментации — число
+            объектов по id класса, для классификации — число изображений по папке класса.
+        ignored (list): Файлы dataset/, которые Ultralytics не читает (в files не входят).
+    """
+
+    def __init__(
+        self, root: str, files: dict, dirs: dict, top: list, histogram: dict, ignored: list | None = None
+    ):
+        self.root = root
+        self.files = files
+        self.dirs = dirs
+        self.top = top
+        self.histogram = histogram
+        self.ignored = ignored or []
+        self._children: dict[str, list[str]] | None = None
+
+    # --- построение и хранение ---
+
+    @classmethod
+    def build(cls, root: str) -> "DatasetManifest":
+        root = os.path.abspath(root)
+        files: dict[str, dict] = {}
+        dirs: dict[str, int] = {}
+        histogram: Counter = Counter()
+        ignored: list[str] = []
+        dirs[""] = os.stat(root).st_mtime_ns
+        for rel, entry in _walk(root):
+            if entry.is_dir(follow_symlinks=False):
+                dirs[rel] = entry.stat(follow_symlinks=False).st_mtime_ns
+                continue
+            parts = rel.split("/")
+            if _ignored(parts):
+                ignored.append(rel)
+                continue
+            st = entry.stat()
+            classes = None
+            if len(parts) == 3 and parts[0] == DATASET_DIR:
+                if parts[1] == "labels" and entry.name.endswith(".txt"):
+                    classes, counts = _label_class_ids(entry.path)
+                    histogram.update({str(k): v for k, v in counts.items()})
+                elif parts[1] not in ("images", "labels"):
+                    histogram[parts[1]] += 1
+            files[rel] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "classes": classes}
+        top = sorted(name for name in os.listdir(root) if name != MANIFEST_NAME)
+        return cls(
+            root, dict(sorted(files.items())), dirs, top, dict(sorted(histogram.items())), sorted(ignored)
+        )
+
+    @classmethod
+    def load(cls, root: str) -> "DatasetManifest | None":
+        """Сохранённый манифест, если он актуален, иначе None."""
+        root = os.path.abspath(root)
+        try:
+            with open(manifest_path(root), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        manifest = cls(
+            root, data["files"], data["dirs"], data["top"], data["histogram"], data["ignored"]
+        )
+        return manifest if manifest.is_fresh() else None
+
+    @classmethod
+    def load_or_build(cls, root: str) -> "DatasetManifest":
+        manifest = cls.load(root)
+        if manifest is None:
+            manifest = cls.build(root)
+            manifest.save()
+            logger.info("Манифест %s: файлов %d, каталогов %d", root, len(manifest.files), len(manifest.dirs))
+        return manifest
+
+    def is_fresh(self) -> bool:
+        """Те же каталоги и файлы, у файлов те же размер и mtime_ns (содержимое не читается)."""
+        dirs = {""}
+        ignored = []
+        seen = 0
+        try:
+            for rel, entry in _walk(self.root):
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.add(rel)
+                    continue
+                if _ignored(rel.split("/")):
+                    ignored.append(rel)
+                    continue
+                known = self.files.get(rel)
+                if known is None:
+                    return False
+                st = entry.stat()
+                if (st.st_size, st.st_mtime_ns) != (known["size"], known["mtime_ns"]):
+                    return False
+                seen += 1
+        except OSError:
+            return False
+        return seen == len(self.files) and dirs == set(self.dirs) and sorted(ignored) == self.ignored
+
+    def save(self) -> None:
+        target = manifest_path(self.root)
+        data = {
+            "version": MANIFEST_VERSION,
+            "files": self.files,
+            "dirs": self.dirs,
+            "top": self.top,
+            "histogram": self.histogram,
+            "ignored": self.ignored,
+        }
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix=os.path.basename(target))
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, target)
+        except OSError as e:
+            logger.warning("Не удалось сохранить манифест %s: %s", target, e)
+
+    # --- запросы ---
+
+    def rel(self, path: str) -> str:
+        """Путь внутри каталога задачи (posix) для абсолютного или относительного пути."""
+        rel = os.path.relpath(os.path.abspath(path), self.root)
+        return "" if rel == "." else rel.replace(os.sep, "/")
+
+    def _index(self) -> dict[str, list[str]]:
+        if self._children is None:
+            children: dict[str, set[str]] = {d: set() for d in self.dirs}
+            for rel_dir in self.dirs:
+                if rel_dir:
+                    parent, _, name = rel_dir.rpartition("/")
+                    children.setdefault(parent, set()).add(name)
+            for rel in self.files:
+                parent, _, name = rel.rpartition("/")
+                children.setdefault(parent, set()).add(name)
+            self._children = {d: sorted(names) for d, names in children.items()}
+        return self._children
+
+    def exists(self, path: str) -> bool:
+        rel = self.rel(path)
+        return rel in self.dirs or rel in self.files
+
+    def isdir(self, path: str) -> bool:
+        return self.rel(path) in self.dirs
+
+    def isfile(self, path: str) -> bool:
+        return self.rel(path) in self.files
+
+    def listdir(self, path: str) -> list[str]:
+        """Имена в каталоге (отсортированы), как os.listdir."""
+        rel = self.rel(path)
+        if rel not in self.dirs:
+            raise FileNotFoundError(f"Директория {path} не найдена")
+        return list(self._index().get(rel, []))
+
+    def classes(self, path: str) -> list[int] | None:
+        """id классов файла разметки (None — не файл разметки или некорректные id)."""
+        entry = self.files.get(self.rel(path))
+        return entry["classes"] if entry else None
+
+    def iter_files(self):
+        """Генератор абсолютных путей всех файлов каталога задачи."""
+        for rel in self.files:
+            yield os.path.join(self.root, *rel.split("/"))
@@ -0,0 +1,84 @@
+"""
+Размещение файлов выборки в data_root без копирования байтов, где это возможно.
+
+Режимы разбиения (SPLIT_MODE):
+    copy — полная копия (прежнее поведение);
+    link — hardlink, иначе reflink (copy-on-write), иначе копия (другая ФС);
+           все, кто пишет в data_root, создают новый файл (os.replace), а не
+           переписывают существующий — иначе изменился бы оригинал в dataset/;
+    list — для сегментации train.txt/val.txt со списком исходных изображений,
+           копируются только файлы, которые загрузчик переписал бы на месте;
+           для классификации — как link.
+"""
+import errno
+import logging
+import os
+import shutil
+
+logger = logging.getLogger(__name__)
+
+SPLIT_MODES = ("copy", "link", "list")
+
+# ioctl FICLONE (linux/fs.h): reflink на btrfs/xfs/overlayfs поверх них
+_FICLONE = 0x40049409
+
+
+def _reflink(src: str, dst: str) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        shutil.copymode(src, dst)
+        return True
+    except OSError:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        return False
+
+
+def _rewritten_by_loader(path: str) -> bool:
+    """
+    JPEG без маркера конца в последних байтах: Ultralytics при проверке датасета
+    пересохраняет такой файл на месте, поэтому ему нужна своя копия, а не ссылка.
+    """
+    if os.path.splitext(path)[1].lower() not in (".jpg", ".jpeg"):
+        return False
+    try:
+        with open(path, "rb") as f:
+            f.seek(-2, os.SEEK_END)
+            return f.read() != b"\xff\xd9"
+    except OSError:
+        return True
+
+
+def materialize(src: str, dst: str, mode: str = "copy") -> None:
+    """
+    Разместить src по пути dst: hardlink/reflink в режимах link и list, иначе копия.
+    Файлы, которые загрузчик может переписать на месте, всегда копируются.
+    """
+    if mode in ("link", "list") and not _rewritten_by_loader(src):
+        try:
+            os.link(src, dst)
+            return
+        except FileExistsError:
+            os.remove(dst)
+            return materialize(src, dst, mode)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+        if _reflink(src, dst):
+            return
+    shutil.copy(src, dst)
+
+
+def normalize_mode(mode: str | None) -> str:
+    mode = (mode or "copy").strip().lower()
+    if mode not in SPLIT_MODES:
+        logger.warning("Неизвестный SPLIT_MODE %r, используется copy", mode)
+        return "copy"
+    return mode
@@ -1,7 +1,10 @@
 import yaml
 import os
+from backend.dataset.manifest import DatasetManifest
+from backend.dataset.materialize import _rewritten_by_loader, materialize, normalize_mode
 from backend.exception.file_system import LabelError, TxtFileNotFoundError, NotEnoughImagesError
-from ml.augmentation import save_with_augmentations
+from ml.augmentation import augment_files, augmentation_jobs, save_with_augmentations
+from ml.sampling import BALANCE_MODES, write_sampling
 from ml.quiet import tqdm_disable
 from ml.seed import set_seed
 import random
@@ -9,14 +12,37 @@ import shutil
 from tqdm import tqdm
 
 class DataSpliting():
-    def __init__(self, path_to_dataset, random_seed=42, shuffle=False):
+    def __init__(self, path_to_dataset, random_seed=42, shuffle=False, subset=None, split_mode="copy", manifest=None,
+                 balance_mode="materialize"):
+        """
+        Параметры:
+            subset (set, optional): относительные пути изображений внутри dataset/
+                ('images/a.jpg' или 'class/a.jpg'), которые попадут в разбиение; None — все.
+            split_mode (str): copy | link | list (см. backend.dataset.materialize).
+            manifest (DatasetManifest, optional): манифест каталога задачи; по умолчанию
+                загружается или строится для родителя path_to_dataset.
+            balance_mode (str): materialize — аугментированные копии редких классов в train;
+                weighted — веса классов в sampling.json (ml.sampling), без копий.
+        """
         self.path_to_dataset = path_to_dataset
         self.random_seed = random_seed
         set_seed(self.random_seed)
         self.shuffle = shuffle
+        self.subset = subset
+        self.split_mode = normalize_mode(split_mode)
+        self.splits = {}
+        self.balance_mode = balance_mode if balance_mode in BALANCE_MODES else "materialize"
+        self.manifest = manifest or DatasetManifest.load_or_build(
+            os.path.dirname(os.path.abspath(path_to_dataset))
+        )
+
+    def _select(self, files, folder):
+        if self.subset is None:
+            return files
+        return [f for f in files if f"{folder}/{f}" in self.subset]
     
     @staticmethod
-    def save_files_to_dir(files, image_dir, label_dir, dest_image_dir, dest_label_dir, desc):
+    def save_files_to_dir(files, image_dir, label_dir, dest_image_dir, dest_label_dir, desc, mode="copy"):
         for file in tqdm(files, desc=desc, disable=tqdm_disable()):
             image_path = os.path.join(image_dir, file)
             dest_image_path = os.path.join(dest_image_dir, file)
@@ -25,113 +51,116 @@ class DataSpliting():
             label_path = os.path.join(label_dir, label_file)
             dest_label_path = os.path.join(dest_label_dir, label_file)
             try:
-                shutil.copy(label_path, dest_label_path)
-                shutil.copy(image_path, dest_image_path)
+                materialize(label_path, dest_label_path, mode)
+                materialize(image_path, dest_image_path, mode)
 
             except Exception:
                 raise TxtFileNotFoundError(label_file, label_dir)
 
+    @staticmethod
+    def save_files_to_list(files, image_dir, label_dir, list_path, label_exists=os.path.isfile, copy_dir=None):
+        """
+        Список изображений выборки для YOLO (train.txt/val.txt) вместо копий:
+        разметку Ultralytics находит по пути изображения (images/ → labels/).
+        Изображения, которые загрузчик пересохранит на месте (битые JPEG), копируются
+        вместе с разметкой в copy_dir/images и copy_dir/labels, и в список попадает копия.
+        """
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for file in files:
+                label_file = os.path.splitext(file)[0] + '.txt'
+                if not label_exists(os.path.join(label_dir, label_file)):
+                    raise TxtFileNotFoundError(label_file, label_dir)
+                image_path = os.path.join(image_dir, file)
+                if copy_dir is not None and _rewritten_by_loader(image_path):
+                    dest_image_dir = os.path.join(copy_dir, 'images')
+                    dest_label_dir = os.path.join(copy_dir, 'labels')
+                    os.makedirs(dest_image_dir, exist_ok=True)
+                    os.makedirs(dest_label_dir, exist_ok=True)
+                    shutil.copy(os.path.join(label_dir, label_file), os.path.join(dest_label_dir, label_file))
+                    image_path = os.path.join(dest_image_dir, file)
+                    shutil.copy(os.path.join(image_dir, file), image_path)
+                f.write(os.path.abspath(image_path) + '\n')
+
     def spliting_seg(self, train_size=0.9, val_size=0.1, test_size=0.0, interactive=True, output_dir=None):
-        if self._get_valsize(val_size, os.path.join(self.path_to_dataset, 'images')) == 0:
+        image_dir = os.path.join(self.path_to_dataset, 'images')
+        label_dir = os.path.join(self.path_to_dataset, 'labels')
+        image_files = self._select(self.manifest.listdir(image_dir), 'images')
+        if int(len(image_files) * val_size) == 0:
             raise(NotEnoughImagesError(self.path_to_dataset))
 
         self.output_dir = output_dir or 'data_root'
-        train_image_dir = os.path.join(self.output_dir, 'train', 'images')
-        train_label_dir = os.path.join(self.output_dir, 'train', 'labels')
-
-        val_image_dir = os.path.join(self.output_dir, 'val', 'images')
-        val_label_dir = os.path.join(self.output_dir, 'val', 'labels')
-
-        test_image_dir = os.path.join(self.output_dir, 'test', 'images') if test_size > 0 else None
-        test_label_dir = os.path.join(self.output_dir, 'test', 'labels') if test_size > 0 else None
-        
-        os.makedirs(train_image_dir, exist_ok=True)
-        os.makedirs(train_label_dir, exist_ok=True)
-
-        os.makedirs(val_image_dir, exist_ok=True)
-        os.makedirs(val_label_dir, exist_ok=True)
+        os.makedirs(self.output_dir, exist_ok=True)
 
-        if test_size > 0:
-            os.makedirs(test_image_dir, exist_ok=True)
-            os.makedirs(test_label_dir, exist_ok=True)
-
-        image_dir = os.path.join(self.path_to_dataset, 'images')
-        label_dir = os.path.join(self.path_to_dataset, 'labels')
-        image_files = sorted(os.listdir(image_dir))
-        
         if self.shuffle:
             random.shuffle(image_files)
 
         num_files = len(image_files)
         train_end = int(num_files * train_size)
         val_end = train_end + int(num_files * val_size)
-        
-        train_files = image_files[:train_end]
-        val_files = image_files[train_end:val_end]
-        test_files = image_files[val_end:] if test_size > 0 else []
-
-        self.save_files_to_dir(train_files, image_dir, label_dir, train_image_dir, train_label_dir, desc="Copying train files")
-        self.save_files_to_dir(val_files, image_dir, label_dir, val_image_dir, val_label_dir, desc="Copying val files")
 
+        split_files = {
+            'train': image_files[:train_end],
+            'val': image_files[train_end:val_end],
+        }
         if test_size > 0:
-            self.save_files_to_dir(test_files, image_dir, label_dir, test_image_dir, test_label_dir, desc="Copying test files")
+            split_files['test'] = image_files[val_end:]
+
+        for split, files in split_files.items():
+            if self.split_mode == 'list':
+                list_file = f'{split}.txt'
+                self.save_files_to_list(
+                    files, image_dir, label_dir, os.path.join(self.output_dir, list_file),
+                    label_exists=self.manifest.isfile,
+                    copy_dir=os.path.join(self.output_dir, split),
+                )
+                self.splits[split] = list_file
+                continue
+            split_image_dir = os.path.join(self.output_dir, split, 'images')
+            split_label_dir = os.path.join(self.output_dir, split, 'labels')
+            os.makedirs(split_image_dir, exist_ok=True)
+            os.makedirs(split_label_dir, exist_ok=True)
+            self.save_files_to_dir(
+                files, image_dir, label_dir, split_image_dir, split_label_dir,
+                desc=f"Copying {split} files", mode=self.split_mode,
+            )
+            self.splits[split] = os.path.join(split, 'images')
+
         if interactive:
             self.building_yaml()
         else:
             self.building_yaml_auto()
 
-    def building_yaml(self):
-        unique_chars = set()
+    def _label_class_ids(self):
+        """id классов из разметки dataset/labels (по манифесту: первый токен строки — целое число)."""
         directory = os.path.join(self.path_to_dataset, 'labels')
-
-        if not os.path.exists(directory):
+        if not self.manifest.isdir(directory):
             raise FileNotFoundError(f"Директория {directory} не найдена")
-        
-        for filename in os.listdir(directory):
-            if filename.endswith(".txt"):
-                filepath = os.path.join(directory, filename)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as file:
-                        for line in file:
-                            line = line.strip()
-                            if line:
-                                unique_chars.add(line[0])
-                except Exception as e:
-                    raise IOError(f"Ошибка при чтении файла {filepath}: {e}")
-            else:
+        class_ids = set()
+        for filename in self.manifest.listdir(directory):
+            if not filename.endswith(".txt"):
                 raise LabelError(filename)
+            classes = self.manifest.classes(os.path.join(directory, filename))
+            if classes is None:
+                raise ValueError("Все уникальные символы в аннотациях должны быть числами")
+            class_ids.update(classes)
+        # YOLO требует id < nc: имена для всех id до максимального
+        return list(range(max(class_ids) + 1)) if class_ids else []
 
+    def building_yaml(self):
         self.names = []
-        try:
-            for el in sorted(map(int, unique_chars)):
-                name = input(f'Класс : {el}. Наименование: ')
-                self.names.append(name)
-        except ValueError:
-            raise ValueError("Все уникальные символы в аннотациях должны быть числами")
+        for el in self._label_class_ids():
+            name = input(f'Класс : {el}. Наименование: ')
+            self.names.append(name)
         self.create_yaml(self.names, self.output_dir)
 
     def building_yaml_auto(self):
-        unique_chars = set()
-        directory = os.path.join(self.path_to_dataset, 'labels')
-        if not os.path.exists(directory):
-            raise FileNotFoundError(f"Директория {directory} не найдена")
-        for filename in os.listdir(directory):
-            if filename.endswith(".txt"):
-                filepath = os.path.join(directory, filename)
-                with open(filepath, 'r', encoding='utf-8') as file:
-                    for line in file:
-                        line = line.strip()
-                        if line:
-                            unique_chars.add(line[0])
-            else:
-                raise LabelError(filename)
-        self.names = [f"class_{i}" for i in sorted(map(int, unique_chars))]
+        self.names = [f"class_{i}" for i in self._label_class_ids()]
         self.create_yaml(self.names, self.output_dir)
 
     def create_yaml(self, names, output_folder):
         data = {
-            'train': os.path.join('train', 'images'),
-            'val': os.path.join('val', 'images'),
+            'train': self.splits.get('train', os.path.join('train', 'images')),
+            'val': self.splits.get('val', os.path.join('val', 'images')),
             'nc': len(names),
             'names': names
         }
@@ -158,26 +187,29 @@ class DataSpliting():
         train_dir = os.path.join(self.output_dir, 'train')
         val_dir = os.path.join(self.output_dir, 'val')
 
-        self.names = os.listdir(self.path_to_dataset)
+        self.names = self.manifest.listdir(self.path_to_dataset)
 
-        class_count = {}
+        files_by_class = {}
         for class_name in self.names:
             class_dir = os.path.join(self.path_to_dataset, class_name)
-            class_count[class_name] = len(os.listdir(class_dir))
+            files_by_class[class_name] = self._select(self.manifest.listdir(class_dir), class_name)
+        class_count = {name: len(files) for name, files in files_by_class.items()}
 
         max_class_name, max_class_count = max(class_count.items(), key=lambda item: item[1])
 
+        # Аугментации всех классов — одним пулом процессов после размещения оригиналов
+        augment_jobs = []
         for class_name in self.names:
             os.makedirs(os.path.join(train_dir, class_name), exist_ok=True)
             os.makedirs(os.path.join(val_dir, class_name), exist_ok=True)
 
             source_dir = os.path.join(self.path_to_dataset, class_name)
-            class_files = os.listdir(source_dir)
+            class_files = files_by_class[class_name]
             
             if self.shuffle:
                 random.shuffle(class_files)
 
-            if self._get_valsize(val_size, source_dir) == 0:
+            if int(len(class_files) * val_size) == 0:
                 raise(NotEnoughImagesError(self.path_to_dataset))
 
             num_files = len(class_files)
@@ -187,15 +219,15 @@ class DataSpliting():
             train_files = class_files[:train_end]
             val_files = class_files[train_end:val_end]
 
-            if class_name != max_class_name:
+            if class_name != max_class_name and self.balance_mode == "materialize":
                 augment_factor = max_class_count // class_count[class_name]
             else:
                 augment_factor = 0
-            save_with_augmentations(train_files, source_dir, train_dir, class_name, desc=f"dir: train | class: {class_name}", augment_factor=augment_factor)
-            save_with_augmentations(val_files, source_dir, val_dir, class_name, desc=f"dir: val | class: {class_name}")
-
-    def _get_valsize(self, val_size, image_dir):
-        image_files = os.listdir(image_dir)
-        num_files = len(image_files)
-        valsize = int(num_files * val_size)
-        return valsize
+            # Ultralytics читает классификацию только из каталогов: list здесь равен link
+            save_with_augmentations(train_files, source_dir, train_dir, class_name, desc=f"dir: train | class: {class_name}", mode=self.split_mode)
+            save_with_augmentations(val_files, source_dir, val_dir, class_name, desc=f"dir: val | class: {class_name}", mode=self.split_mode)
+            augment_jobs += augmentation_jobs(train_files, source_dir, train_dir, class_name, augment_factor, seed=self.random_seed)
+
+        augment_files(augment_jobs, desc="dir: train | augmentation")
+        if self.balance_mode == "weighted":
+            write_sampling(self.output_dir, class_count)
@@ -1,22 +1,30 @@
 import os
+from backend.dataset.manifest import DatasetManifest
 from backend.exception.file_system import IncorrectDatasetFormatError
 
-def determine_task_type(path_dataset):
+def determine_task_type(path_dataset, manifest=None):
+    """
+    Параметры:
+        manifest (DatasetManifest, optional): манифест каталога задачи; по умолчанию
+            строится (или загружается) для родителя path_dataset.
+    """
     if not os.path.exists(path_dataset):
         raise FileNotFoundError(f"Директория {path_dataset} не найдена.")
-    top_level_items = os.listdir(path_dataset)
+    if manifest is None:
+        manifest = DatasetManifest.load_or_build(os.path.dirname(os.path.abspath(path_dataset)))
+    top_level_items = manifest.listdir(path_dataset)
     
     if 'images' in top_level_items and 'labels' in top_level_items:
-        images_path = os.path.join(path_dataset, 'images')
-        labels_path = os.path.join(path_dataset, 'labels')
+        images = manifest.listdir(os.path.join(path_dataset, 'images'))
+        labels = manifest.listdir(os.path.join(path_dataset, 'labels'))
         
-        if os.listdir(images_path) and os.listdir(labels_path):
-            if all(file.endswith(".txt") for file in os.listdir(labels_path)):
+        if images and labels:
+            if all(file.endswith(".txt") for file in labels):
                 return "сегментация"
     
     elif all(
-        os.path.isdir(os.path.join(path_dataset, item)) and 
-        os.listdir(os.path.join(path_dataset, item))
+        manifest.isdir(os.path.join(path_dataset, item)) and 
+        manifest.listdir(os.path.join(path_dataset, item))
         for item in top_level_items
     ):
         return "классификация"
@@ -0,0 +1,318 @@
+"""
+Проверка датасета сразу после распаковки, до постановки задачи обучения.
+
+Изображения проверяются по заголовкам (формат, размеры, признак обрезанного файла)
+без полного декодирования — backend не зависит от PIL; разметка сегментации — на
+наличие и формат строк YOLO. Файлы читаются пулом потоков, отчёт собирается по
+всему датасету, а не до первой ошибки. Файлы, которые Ultralytics не читает
+(.DS_Store, Thumbs.db, README — см. DatasetManifest.ignored), не попадают ни в
+проверку, ни в разбиение и перечисляются в отчёте как предупреждения.
+"""
+from __future__ import annotations
+
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from backend.dataset.manifest import DatasetManifest
+# Окно в конце файла для быстрого поиска маркера конца (допускается хвост после него)
+TAIL_BYTES = 4096
+SCAN_CHUNK = 1 << 20
+MAX_WORKERS = 32
+
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class _InvalidImage(Exception):
+    pass
+
+
+@dataclass
+class ValidationReport:
+    """
+    Атрибуты:
+        checked (int): Проверено файлов.
+        errors (list): [(путь внутри dataset/, описание)].
+        skipped (list): Пропущенные файлы, которые Ultralytics не читает (пути внутри dataset/).
+    """
+
+    checked: int = 0
+    errors: list[tuple[str, str]] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def to_dict(self, limit: int = 100) -> dict:
+        return {
+            "checked": self.checked,
+            "total_errors": len(self.errors),
+            "errors": [{"path": path, "error": error} for path, error in self.errors[:limit]],
+            "total_skipped": len(self.skipped),
+            "skipped": self.skipped[:limit],
+        }
+
+
+def _tail(f, size: int) -> bytes:
+    f.seek(max(0, size - TAIL_BYTES))
+    return f.read()
+
+
+def _contains_after(f, start: int, needle: bytes) -> bool:
+    """Есть ли needle в файле начиная со смещения start (чтение блоками)."""
+    f.seek(start)
+    carry = b""
+    while chunk := f.read(SCAN_CHUNK):
+        if needle in carry + chunk:
+            return True
+        carry = chunk[-(len(needle) - 1):]
+    return False
+
+
+def _jpeg(f, size: int) -> tuple[int, int]:
+    """
+    Размеры из SOF; файл не обрезан, если после начала сжатых данных (первый SOS)
+    есть маркер EOI — внутри сжатых данных 0xFF всегда экранируется, поэтому EOI
+    там не встречается, а метаданные после EOI допустимы любой длины.
+    """
+    f.seek(2)
+    dimensions = None
+    while True:
+        byte = f.read(1)
+        while byte == b"\xff":
+            byte = f.read(1)
+        if not byte:
+            raise _InvalidImage("JPEG: заголовок обрезан")
+        marker = byte[0]
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            continue
+        raw = f.read(2)
+        if len(raw) < 2:
+            raise _InvalidImage("JPEG: заголовок обрезан")
+        length = struct.unpack(">H", raw)[0]
+        if marker in _JPEG_SOF and dimensions is None:
+            sof = f.read(5)
+            if len(sof) < 5:
+                raise _InvalidImage("JPEG: заголовок обрезан")
+            height, width = struct.unpack(">HH", sof[1:5])
+            dimensions = width, height
+            f.seek(length - 7, os.SEEK_CUR)
+            continue
+        if marker in (0xD9, 0xDA) and dimensions is None:
+            raise _InvalidImage("JPEG: нет заголовка кадра (SOF)")
+        if marker == 0xDA:
+            scan_start = f.tell() + length - 2
+            if b"\xff\xd9" not in _tail(f, size) and not _contains_after(f, scan_start, b"\xff\xd9"):
+                raise _InvalidImage("JPEG: нет маркера конца, файл обрезан")
+            return dimensions
+        if marker == 0xD9:
+            raise _InvalidImage("JPEG: нет сжатых данных (SOS)")
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def _png(f, size: int) -> tuple[int, int]:
+    header = f.read(24)
+    if len(header) < 24 or header[12:16] != b"IHDR":
+        raise _InvalidImage("PNG: нет заголовка IHDR")
+    width, height = struct.unpack(">II", header[16:24])
+    if b"IEND" not in _tail(f, size):
+        raise _InvalidImage("PNG: нет блока IEND, файл обрезан")
+    return width, height
+
+
+def _bmp(f, size: int) -> tuple[int, int]:
+    header = f.read(26)
+    if len(header) < 26:
+        raise _InvalidImage("BMP: заголовок обрезан")
+    declared = struct.unpack("<I", header[2:6])[0]
+    width, height = struct.unpack("<ii", header[18:26])
+    if declared and size < declared:
+        raise _InvalidImage(f"BMP: файл обрезан ({size} из {declared} байт)")
+    return abs(width), abs(height)
+
+
+def _webp(f, size: int) -> tuple[int, int]:
+    header = f.read(30)
+    if len(header) < 30 or header[8:12] != b"WEBP":
+        raise _InvalidImage("WEBP: заголовок обрезан")
+    declared = struct.unpack("<I", header[4:8])[0] + 8
+    if size < declared:
+        raise _InvalidImage(f"WEBP: файл обрезан ({size} из {declared} байт)")
+    chunk = header[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        bits = struct.unpack("<I", header[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        width = int.from_bytes(header[24:27], "little") + 1
+        height = int.from_bytes(header[27:30], "little") + 1
+        return width, height
+    raise _InvalidImage("WEBP: неизвестный формат блока")
+
+
+# Типы полей TIFF: код → (формат struct, размер)
+_TIFF_TYPES = {3: ("H", 2), 4: ("I", 4), 16: ("Q", 8)}
+# ImageWidth, ImageLength, StripOffsets, StripByteCounts, TileOffsets, TileByteCounts
+_TIFF_TAGS = (256, 257, 273, 279, 324, 325)
+
+
+def _tiff(f, size: int) -> tuple[int, int]:
+    """
+    Размеры из первого IFD (классический TIFF и BigTIFF); файл не обрезан, если
+    все полосы или тайлы изображения лежат внутри файла.
+    """
+    header = f.read(16)
+    order = "<" if header[:2] == b"II" else ">"
+    version = struct.unpack(order + "H", header[2:4])[0]
+    if version == 42:
+        ifd = struct.unpack(order + "I", header[4:8])[0]
+        count_fmt, entry_fmt, entry_size, inline = "H", "HHI4s", 12, 4
+    elif version == 43:
+        ifd = struct.unpack(order + "Q", header[8:16])[0]
+        count_fmt, entry_fmt, entry_size, inline = "Q", "HHQ8s", 20, 8
+    else:
+        raise _InvalidImage("TIFF: неизвестная версия заголовка")
+    f.seek(ifd)
+    raw = f.read(struct.calcsize(order + count_fmt))
+    if not raw:
+        raise _InvalidImage("TIFF: IFD за пределами файла")
+    entries = struct.unpack(order + count_fmt, raw)[0]
+    table = f.read(entries * entry_size)
+    if len(table) < entries * entry_size:
+        raise _InvalidImage("TIFF: IFD обрезан")
+    tags: dict[int, list[int]] = {}
+    for i in range(entries):
+        tag, kind, count, value = struct.unpack(
+            order + entry_fmt, table[i * entry_size:(i + 1) * entry_size]
+        )
+        if tag not in _TIFF_TAGS or kind not in _TIFF_TYPES:
+            continue
+        fmt, item = _TIFF_TYPES[kind]
+        if count * item <= inline:
+            data = value[:count * item]
+        else:
+            f.seek(struct.unpack(order + ("I" if inline == 4 else "Q"), value)[0])
+            data = f.read(count * item)
+            if len(data) < count * item:
+                raise _InvalidImage("TIFF: значения тега за пределами файла")
+        tags[tag] = list(struct.unpack(f"{order}{count}{fmt}", data))
+    if 256 not in tags or 257 not in tags:
+        raise _InvalidImage("TIFF: нет размеров изображения")
+    for offsets_tag, counts_tag in ((273, 279), (324, 325)):
+        ends = zip(tags.get(offsets_tag, []), tags.get(counts_tag, []))
+        if any(offset + length > size for offset, length in ends):
+            raise _InvalidImage("TIFF: данные изображения за пределами файла, файл обрезан")
+    return tags[256][0], tags[257][0]
+
+
+def read_image_header(path: str) -> tuple[str, int, int]:
+    """(формат, ширина, высота) по заголовку файла; _InvalidImage — если файл не читается."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        magic = f.read(12)
+        f.seek(0)
+        if magic.startswith(b"\xff\xd8"):
+            fmt, reader = "JPEG", _jpeg
+        elif magic.startswith(b"\x89PNG\r\n\x1a\n"):
+            fmt, reader = "PNG", _png
+        elif magic.startswith(b"BM"):
+            fmt, reader = "BMP", _bmp
+        elif magic.startswith(b"RIFF") and magic[8:12] == b"WEBP":
+            fmt, reader = "WEBP", _webp
+        elif magic[:4] in (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+"):
+            fmt, reader = "TIFF", _tiff
+        else:
+            raise _InvalidImage("неизвестный формат изображения")
+        width, height = reader(f, size)
+    if width <= 0 or height <= 0:
+        raise _InvalidImage(f"{fmt}: некорректный размер {width}x{height}")
+    return fmt, width, height
+
+
+def _check_image(path: str) -> str | None:
+    try:
+        read_image_header(path)
+    except _InvalidImage as e:
+        return str(e)
+    except struct.error:
+        return "заголовок изображения обрезан"
+    except OSError as e:
+        return f"не удалось прочитать: {e}"
+    return None
+
+
+def _check_label(path: str) -> str | None:
+    """Строки YOLO: целый id класса и нормированные координаты (bbox — 4, полигон — пары, от 3 точек)."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except (OSError, UnicodeDecodeError) as e:
+        return f"не удалось прочитать разметку: {e}"
+    for number, line in enumerate(lines, start=1):
+        parts = line.split()
+        if not parts:
+            continue
+        try:
+            int(parts[0])
+            coords = [float(v) for v in parts[1:]]
+        except ValueError:
+            return f"строка {number}: id класса и координаты должны быть числами"
+        if len(coords) != 4 and (len(coords) < 6 or len(coords) % 2):
+            return f"строка {number}: ожидается 4 координаты bbox или не меньше 3 точек полигона"
+        if any(v < 0 or v > 1.0001 for v in coords):
+            return f"строка {number}: координаты должны быть нормированы в [0, 1]"
+    return None
+
+
+def validate_dataset(
+    path_dataset: str,
+    task_type: str,
+    manifest: DatasetManifest | None = None,
+    workers: int | None = None,
+) -> ValidationReport:
+    """
+    Проверить dataset/ задачи task_type ('сегментация' или 'классификация').
+    Возвращает отчёт со всеми найденными ошибками; файлы из manifest.ignored
+    не проверяются и перечисляются в report.skipped.
+    """
+    manifest = manifest or DatasetManifest.load_or_build(os.path.dirname(os.path.abspath(path_dataset)))
+    report = ValidationReport()
+    checks: list[tuple[str, object]] = []
+
+    def rel(path: str) -> str:
+        return os.path.relpath(path, path_dataset).replace(os.sep, "/")
+
+    if task_type == "сегментация":
+        image_dir = os.path.join(path_dataset, "images")
+        label_dir = os.path.join(path_dataset, "labels")
+        for name in manifest.listdir(image_dir):
+            image = os.path.join(image_dir, name)
+            label = os.path.join(label_dir, os.path.splitext(name)[0] + ".txt")
+            checks.append((image, _check_image))
+            if manifest.isfile(label):
+                checks.append((label, _check_label))
+            else:
+                report.errors.append((rel(image), "нет файла разметки labels/" + os.path.basename(label)))
+    else:
+        for class_name in manifest.listdir(path_dataset):
+            class_dir = os.path.join(path_dataset, class_name)
+            names = manifest.listdir(class_dir)
+            if not names:
+                report.errors.append((class_name, "в папке класса нет изображений"))
+            checks.extend((os.path.join(class_dir, name), _check_image) for name in names)
+
+    workers = workers or min(MAX_WORKERS, 4 * (os.cpu_count() or 1))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(lambda item: item[1](item[0]), checks)
+        for (path, _), error in zip(checks, results):
+            if error:
+                report.errors.append((rel(path), error))
+    report.checked = len(checks)
+    report.errors.sort()
+    prefix = manifest.rel(path_dataset) + "/"
+    report.skipped = [path[len(prefix):] for path in manifest.ignored if path.startswith(prefix)]
+    return report
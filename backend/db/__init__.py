@@ -1,4 +1,4 @@
 from backend.db.orm import SyncOrm
-from backend.db.models import Base, DatasetOrm, ModelsOrm
+from backend.db.models import Base, DatasetOrm, ImgszCacheOrm, ModelsOrm
 
-__all__ = ["SyncOrm", "Base", "DatasetOrm", "ModelsOrm"]
+__all__ = ["SyncOrm", "Base", "DatasetOrm", "ImgszCacheOrm", "ModelsOrm"]
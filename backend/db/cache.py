@@ -0,0 +1,51 @@
+"""
+Кэш метаданных моделей и датасетов для часто опрашиваемых эндпоинтов backend.
+
+Кэш живёт в процессе backend, а модели и флаги обучения пишет worker (другой
+процесс), поэтому записи сбрасываются по папке только при синхронизации после
+обучения (internal API). В остальных случаях устаревание ограничено
+METADATA_CACHE_TTL секундами.
+"""
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+from backend.config import settings
+
+_MISSING = object()
+
+
+class MetadataCache:
+    """Потокобезопасный кэш {(вид, папка): значение} с TTL."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: dict[tuple[str, str], tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get_or_load(self, kind: str, folder: str, loader: Callable[[], Any]) -> Any:
+        if self.ttl <= 0:
+            return loader()
+        key = (kind, folder)
+        now = time.monotonic()
+        with self._lock:
+            expires, value = self._entries.get(key, (0.0, _MISSING))
+        if value is not _MISSING and expires > now:
+            return value
+        value = loader()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self, folder: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[1] == folder]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+metadata_cache = MetadataCache(settings.METADATA_CACHE_TTL)
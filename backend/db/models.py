@@ -1,7 +1,7 @@
 import json
 from datetime import datetime
 
-from sqlalchemy import VARCHAR, Index, Boolean, Text, INTEGER, UniqueConstraint, DateTime
+from sqlalchemy import VARCHAR, Index, Boolean, Text, INTEGER, UniqueConstraint, DateTime, text
 from sqlalchemy.orm import Mapped, mapped_column
 from typing import Annotated
 
@@ -41,6 +41,16 @@ class ModelsOrm(Base):
         DateTime(timezone=True), nullable=True
     )
 
+    __table_args__ = (
+        # Последняя версия папки: select_model и list_models_latest
+        Index(
+            "models_folder_version_index",
+            "train_folder",
+            text("version DESC"),
+            text("id DESC"),
+        ),
+    )
+
     @property
     def classes(self) -> list:
         return json.loads(self._classes) if self._classes else []
@@ -48,3 +58,17 @@ class ModelsOrm(Base):
     @classes.setter
     def classes(self, value: list):
         self._classes = json.dumps(value, ensure_ascii=False)
+
+
+class ImgszCacheOrm(Base):
+    """Результаты check_imgsz по отпечатку содержимого датасета (общий кэш всех worker)."""
+
+    __tablename__ = "imgsz_cache"
+
+    cache_key: Mapped[str] = mapped_column(VARCHAR(64), primary_key=True)
+    model_type: Mapped[strmy]
+    imgsz: Mapped[intk]
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    used_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+    __table_args__ = (Index("imgsz_cache_used_at_index", "used_at"),)
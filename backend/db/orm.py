@@ -1,11 +1,17 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
-from sqlalchemy import select, and_, update, desc, func
+from sqlalchemy import select, and_, or_, update, delete, desc, func
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import IntegrityError
 
-from backend.db.models import Base, DatasetOrm, ModelsOrm
+from backend.db.cache import metadata_cache
+from backend.db.models import Base, DatasetOrm, ImgszCacheOrm, ModelsOrm
 from backend.db.database import session_factory, sync_engine
 
+# Строк на один INSERT при индексации (3 параметра на строку, лимит PostgreSQL — 65535)
+INSERT_BATCH_SIZE = 5000
+
 
 class SyncOrm:
     @staticmethod
@@ -28,6 +34,35 @@ class SyncOrm:
             except IntegrityError:
                 session.rollback()
 
+    @staticmethod
+    def insert_data_bulk(folder, paths, batch_size=INSERT_BATCH_SIZE) -> int:
+        """
+        Индексация файлов папки пачками: INSERT ... ON CONFLICT DO NOTHING,
+        одна транзакция на пачку. Возвращает число новых записей.
+        """
+        inserted = 0
+        batch = []
+        with session_factory() as session:
+            for path in paths:
+                batch.append({"folder": folder, "path": path, "trained_flag": False})
+                if len(batch) >= batch_size:
+                    inserted += SyncOrm._insert_batch(session, batch)
+                    batch = []
+            if batch:
+                inserted += SyncOrm._insert_batch(session, batch)
+        return inserted
+
+    @staticmethod
+    def _insert_batch(session, batch) -> int:
+        stmt = (
+            pg_insert(DatasetOrm)
+            .values(batch)
+            .on_conflict_do_nothing(constraint="unique_folder_path_constraint")
+        )
+        result = session.execute(stmt)
+        session.commit()
+        return max(result.rowcount, 0)
+
     @staticmethod
     def select_data(folder):
         with session_factory() as session:
@@ -88,47 +123,113 @@ class SyncOrm:
             return session.execute(query).fetchone()
 
     @staticmethod
-    def list_models_latest():
-        """По одной записи на train_folder — последняя версия."""
-        with session_factory() as session:
-            rows = (
-                session.execute(
-                    select(ModelsOrm).order_by(
-                        ModelsOrm.train_folder, desc(ModelsOrm.version)
-                    )
-                )
-                .scalars()
-                .all()
+    def select_model_cached(folder):
+        """select_model через кэш метаданных (эндпоинты API, которые опрашивает frontend)."""
+        return metadata_cache.get_or_load("model", folder, lambda: SyncOrm.select_model(folder))
+
+    @staticmethod
+    def list_models_latest(
+        limit: int | None = None,
+        after: tuple[datetime | None, str] | None = None,
+    ) -> list[ModelsOrm]:
+        """
+        По одной записи на train_folder — последняя версия; сначала недавно обученные.
+        Выборка целиком в PostgreSQL (row_number по индексу models_folder_version_index).
+
+        Аргументы:
+            limit (int | None): Не больше стольких записей (None — все).
+            after (tuple | None): (trained_at, train_folder) последней записи предыдущей
+                страницы — курсор для постраничной выдачи.
+        """
+        rank = (
+            func.row_number()
+            .over(
+                partition_by=ModelsOrm.train_folder,
+                order_by=(desc(ModelsOrm.version), desc(ModelsOrm.id)),
             )
-            seen: set[str] = set()
-            out: list[ModelsOrm] = []
-            for r in rows:
-                if r.train_folder in seen:
-                    continue
-                seen.add(r.train_folder)
-                out.append(r)
-            out.sort(
-                key=lambda m: (
-                    m.trained_at is None,
-                    -(m.trained_at.timestamp()) if m.trained_at else 0.0,
+            .label("rank")
+        )
+        ranked = select(ModelsOrm, rank).subquery()
+        latest = aliased(ModelsOrm, ranked)
+        query = select(latest).where(ranked.c.rank == 1)
+        if after is not None:
+            trained_at, folder = after
+            if trained_at is None:
+                query = query.where(latest.trained_at.is_(None), latest.train_folder > folder)
+            else:
+                query = query.where(
+                    or_(
+                        latest.trained_at < trained_at,
+                        and_(latest.trained_at == trained_at, latest.train_folder > folder),
+                        latest.trained_at.is_(None),
+                    )
                 )
-            )
-            return out
+        query = query.order_by(latest.trained_at.desc().nulls_last(), latest.train_folder)
+        if limit is not None:
+            query = query.limit(limit)
+        with session_factory() as session:
+            return list(session.execute(query).scalars().all())
 
     @staticmethod
     def dataset_stats(folder: str) -> tuple[int, int]:
         """(всего файлов, не помеченных как обученные)."""
         with session_factory() as session:
-            total = session.execute(
-                select(func.count())
+            total, pending = session.execute(
+                select(
+                    func.count(),
+                    func.count().filter(DatasetOrm.trained_flag.is_(False)),
+                )
                 .select_from(DatasetOrm)
                 .where(DatasetOrm.folder == folder)
-            ).scalar()
-            pending = session.execute(
-                select(func.count())
-                .select_from(DatasetOrm)
-                .where(
-                    and_(DatasetOrm.folder == folder, DatasetOrm.trained_flag.is_(False))
-                )
-            ).scalar()
+            ).one()
             return int(total or 0), int(pending or 0)
+
+    @staticmethod
+    def dataset_stats_cached(folder: str) -> tuple[int, int]:
+        return metadata_cache.get_or_load("stats", folder, lambda: SyncOrm.dataset_stats(folder))
+
+    @staticmethod
+    def select_imgsz_cache(cache_key: str) -> int | None:
+        """imgsz из общего кэша check_imgsz; отмечает запись как использованную."""
+        with session_factory() as session:
+            row = session.get(ImgszCacheOrm, cache_key)
+            if row is None:
+                return None
+            row.used_at = datetime.now(timezone.utc)
+            session.commit()
+            return int(row.imgsz)
+
+    @staticmethod
+    def upsert_imgsz_cache(cache_key: str, model_type: str, imgsz: int) -> None:
+        """Атомарная запись результата check_imgsz (INSERT ... ON CONFLICT DO UPDATE)."""
+        now = datetime.now(timezone.utc)
+        stmt = pg_insert(ImgszCacheOrm).values(
+            cache_key=cache_key,
+            model_type=model_type,
+            imgsz=imgsz,
+            created_at=now,
+            used_at=now,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ImgszCacheOrm.cache_key],
+            set_={"imgsz": stmt.excluded.imgsz, "created_at": now, "used_at": now},
+        )
+        with session_factory() as session:
+            session.execute(stmt)
+            session.commit()
+
+    @staticmethod
+    def evict_imgsz_cache(max_entries: int, max_age: timedelta) -> None:
+        """Удалить записи старше max_age и всё сверх max_entries последних использованных."""
+        cutoff = datetime.now(timezone.utc) - max_age
+        keep = (
+            select(ImgszCacheOrm.cache_key)
+            .order_by(desc(ImgszCacheOrm.used_at))
+            .limit(max_entries)
+        )
+        with session_factory() as session:
+            session.execute(delete(ImgszCacheOrm).where(ImgszCacheOrm.created_at < cutoff))
+            session.execute(
+                delete(ImgszCacheOrm).where(ImgszCacheOrm.cache_key.not_in(keep))
+            )
+            session.commit()
@@ -79,3 +79,24 @@ class IncorrectDatasetFormatError(Exception):
             "│   ├── image2.txt\n"
             "│   └── ...\n"
         )
+
+
+class DatasetValidationError(Exception):
+    def __init__(self, report) -> None:
+        self.report = report
+        super().__init__(
+            f"Датасет не прошёл проверку: ошибок {len(report.errors)} из {report.checked} проверенных файлов."
+        )
+
+
+class ArchiveError(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+
+
+class UploadTooLargeError(Exception):
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        super().__init__(
+            f"Размер загрузки превышает допустимый ({max_bytes / 2**20:.0f} МБ)."
+        )
@@ -1,61 +1,266 @@
 """Загрузка артефактов (результаты инференса) в Google Drive из worker (ml/model.py)."""
 from __future__ import annotations
 
+import io
 import logging
+import mimetypes
 import os
+import queue
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
 
+from google.auth.credentials import AnonymousCredentials
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
 
 from backend.app.services.drive import _escape_drive_query_literal
 from backend.config import settings
 
 logger = logging.getLogger(__name__)
 
+FOLDER_MIME = "application/vnd.google-apps.folder"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# 403 повторяется только при превышении квоты запросов; insufficientPermissions,
+# storageQuotaExceeded и т.п. — постоянные ошибки
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
 
-def upload_to_drive(filepath: str, drive_path: str) -> None:
-    if os.environ.get("SKIP_DRIVE_UPLOAD", "").lower() in ("1", "true", "yes"):
-        return
+
+def drive_upload_enabled() -> bool:
+    return os.environ.get("SKIP_DRIVE_UPLOAD", "").lower() not in ("1", "true", "yes")
+
+
+def _build_service():
+    """
+    Клиент Drive v3 по сервисному аккаунту. При DRIVE_API_ENDPOINT (локальный или
+    фейковый Drive) используется этот адрес и анонимные учётные данные.
+    """
+    if settings.DRIVE_API_ENDPOINT:
+        return build(
+            "drive",
+            "v3",
+            credentials=AnonymousCredentials(),
+            client_options={"api_endpoint": settings.DRIVE_API_ENDPOINT},
+            cache_discovery=False,
+        )
     creds = service_account.Credentials.from_service_account_file(
         settings.SERVICE_ACCOUNT_FILE
     )
-    service = build("drive", "v3", credentials=creds)
+    return build("drive", "v3", credentials=creds, cache_discovery=False)
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, HttpError):
+        if error.resp.status == 403:
+            details = getattr(error, "error_details", None)
+            details = details if isinstance(details, list) else []
+            return any(
+                isinstance(d, dict) and d.get("reason") in RATE_LIMIT_REASONS for d in details
+            )
+        return error.resp.status in RETRY_STATUSES
+    return isinstance(error, (OSError, TimeoutError))
+
 
-    folder_id = settings.DRIVE_FOLDER_ID
-    for folder_name in drive_path.split(os.sep):
-        if not folder_name:
-            continue
-        logger.info("Drive: обработка папки %s", folder_name)
+class DriveUploader:
+    """
+    Загрузчик результатов в Google Drive на весь прогон инференса.
+
+    Клиент Drive создаётся один раз на поток загрузки, соответствие путь → id папки
+    кэшируется, файлы уходят через ограниченную очередь пулом потоков с повтором
+    и экспоненциальной задержкой. submit() никогда не ждёт: при заполненной очереди
+    файл записывается на диск (DRIVE_UPLOAD_SPILL_DIR, по умолчанию временный каталог)
+    и загружается, когда потоки разберут очередь; пропускается файл, только если
+    записать его на диск не удалось (счётчик dropped).
+
+    Атрибуты:
+        root_folder_id (str): Корневая папка Drive (по умолчанию DRIVE_FOLDER_ID).
+        retries (int): Число повторов при 429/5xx, 403 из-за квоты запросов и сетевых ошибках.
+        backoff (float): Базовая задержка повтора, секунды.
+    """
+
+    def __init__(
+        self,
+        root_folder_id: str | None = None,
+        max_workers: int | None = None,
+        max_pending: int | None = None,
+        retries: int = 5,
+        backoff: float = 1.0,
+        service_factory=None,
+    ):
+        self.root_folder_id = root_folder_id or settings.DRIVE_FOLDER_ID
+        self.retries = retries
+        self.backoff = backoff
+        self._service_factory = service_factory or _build_service
+        self._local = threading.local()
+        self._folders: dict[str, str] = {}
+        self._folder_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.uploaded = 0
+        self.failed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self._spill: deque = deque()
+        self._spill_lock = threading.Lock()
+        self._spill_dir: str | None = None
+        self._queue: queue.Queue = queue.Queue(
+            maxsize=max_pending or settings.DRIVE_UPLOAD_QUEUE
+        )
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"drive-upload-{i}", daemon=True)
+            for i in range(max_workers or settings.DRIVE_UPLOAD_WORKERS)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, name: str, data: bytes, drive_path: str) -> bool:
+        """
+        Поставить файл в очередь без ожидания; при заполненной очереди — на диск.
+        False, если файл не удалось сохранить и он пропущен.
+        """
+        try:
+            self._queue.put_nowait((name, data, drive_path))
+            return True
+        except queue.Full:
+            pass
+        try:
+            with self._spill_lock:
+                if self._spill_dir is None:
+                    self._spill_dir = tempfile.mkdtemp(
+                        prefix="drive_spill_", dir=settings.DRIVE_UPLOAD_SPILL_DIR or None
+                    )
+                path = os.path.join(self._spill_dir, str(self.spilled))
+                self.spilled += 1
+            with open(path, "wb") as f:
+                f.write(data)
+        except OSError as e:
+            self._count("dropped")
+            logger.warning(
+                "Drive: очередь заполнена и файл %s не удалось записать на диск (%s), пропущено %d",
+                name,
+                e,
+                self.dropped,
+            )
+            return False
+        with self._spill_lock:
+            self._spill.append((name, path, drive_path))
+        return True
+
+    def close(self) -> None:
+        """Дождаться загрузки поставленных файлов (и записанных на диск) и остановить потоки."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self._spill_dir:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+        logger.info(
+            "Drive: загружено %d, ошибок %d, через диск %d, пропущено %d",
+            self.uploaded,
+            self.failed,
+            self.spilled,
+            self.dropped,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _service(self):
+        service = getattr(self._local, "service", None)
+        if service is None:
+            service = self._local.service = self._service_factory()
+        return service
+
+    def _with_retry(self, call):
+        for attempt in range(self.retries + 1):
+            try:
+                return call()
+            except Exception as e:
+                if attempt == self.retries or not _is_retryable(e):
+                    raise
+                delay = self.backoff * 2**attempt * (1 + random.random())
+                logger.info("Drive: повтор через %.1f с (%s)", delay, e)
+                time.sleep(delay)
+
+    def _folder_id(self, drive_path: str) -> str:
+        """id папки drive_path от корня; недостающие папки создаются, результат кэшируется."""
+        parts = [p for p in drive_path.split(os.sep) if p]
+        # Под одной блокировкой: параллельные загрузки не создадут дубликаты папок
+        with self._folder_lock:
+            folder_id = self.root_folder_id
+            for depth in range(len(parts)):
+                key = "/".join(parts[: depth + 1])
+                cached = self._folders.get(key)
+                if cached is None:
+                    cached = self._find_or_create_folder(folder_id, parts[depth])
+                    self._folders[key] = cached
+                folder_id = cached
+            return folder_id
+
+    def _find_or_create_folder(self, parent_id: str, folder_name: str) -> str:
+        files = self._service().files()
         safe_name = _escape_drive_query_literal(folder_name)
         query = (
-            f"'{folder_id}' in parents and name = '{safe_name}' "
-            "and mimeType = 'application/vnd.google-apps.folder'"
+            f"'{parent_id}' in parents and name = '{safe_name}' "
+            f"and mimeType = '{FOLDER_MIME}' and trashed = false"
         )
-        response = (
-            service.files()
-            .list(q=query, spaces="drive", fields="files(id, name)")
-            .execute()
+        response = self._with_retry(
+            lambda: files.list(q=query, spaces="drive", fields="files(id, name)").execute()
         )
-        files = response.get("files", [])
-
-        if not files:
-            logger.info("Папка '%s' не найдена, создаём", folder_name)
-            file_metadata = {
-                "name": folder_name,
-                "mimeType": "application/vnd.google-apps.folder",
-                "parents": [folder_id],
-            }
-            folder = service.files().create(body=file_metadata, fields="id").execute()
-            folder_id = folder.get("id")
-        else:
-            folder_id = files[0]["id"]
-
-    file_metadata = {"name": filepath.split(os.sep)[-1], "parents": [folder_id]}
-    media = MediaFileUpload(filepath)
-    uploaded = (
-        service.files()
-        .create(body=file_metadata, media_body=media, fields="id")
-        .execute()
-    )
-    logger.info("Файл загружен в Drive, id=%s", uploaded.get("id"))
+        found = response.get("files", [])
+        if found:
+            return found[0]["id"]
+        logger.info("Папка '%s' не найдена, создаём", folder_name)
+        metadata = {"name": folder_name, "mimeType": FOLDER_MIME, "parents": [parent_id]}
+        folder = self._with_retry(lambda: files.create(body=metadata, fields="id").execute())
+        return folder["id"]
+
+    def _upload(self, name: str, data: bytes, drive_path: str) -> None:
+        files = self._service().files()
+        metadata = {"name": name, "parents": [self._folder_id(drive_path)]}
+        mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+        def create():
+            media = MediaIoBaseUpload(io.BytesIO(data), mimetype=mimetype)
+            return files.create(body=metadata, media_body=media, fields="id").execute()
+
+        self._with_retry(create)
+
+    def _next_spilled(self) -> tuple[str, bytes, str] | None:
+        with self._spill_lock:
+            if not self._spill:
+                return None
+            name, path, drive_path = self._spill.popleft()
+        with open(path, "rb") as f:
+            data = f.read()
+        os.remove(path)
+        return name, data, drive_path
+
+    def _worker(self) -> None:
+        while True:
+            # Файлы с диска — в первую очередь: они попали туда, пока очередь была полна
+            item = self._next_spilled() or self._queue.get()
+            if item is None:
+                # Остановка: дозагрузить то, что ещё лежит на диске
+                item = self._next_spilled()
+                if item is None:
+                    return
+                self._queue.put(None)
+            name, data, drive_path = item
+            try:
+                self._upload(name, data, drive_path)
+                self._count("uploaded")
+            except Exception as e:
+                self._count("failed")
+                logger.warning("Drive: не удалось загрузить %s: %s", name, e)
@@ -0,0 +1,83 @@
+"""
+Скорость индексации файлов папки в таблице database: прежний SyncOrm.insert_data
+(транзакция на файл) и SyncOrm.insert_data_bulk (пачки с ON CONFLICT DO NOTHING).
+
+Нужен доступный PostgreSQL (DATABASE_URL или DB_* как у backend). Записи пишутся
+под отдельным folder и удаляются после замера. Запуск из корня репозитория:
+    python -m benchmarks.bench_indexing --files 10000 100000 --legacy-max 10000
+"""
+import argparse
+import time
+import uuid
+
+from sqlalchemy import delete
+
+from backend.db.database import session_factory
+from backend.db.models import DatasetOrm
+from backend.db.orm import INSERT_BATCH_SIZE, SyncOrm
+
+
+def _paths(folder: str, count: int) -> list[str]:
+    return [f"/data/{folder}/dataset/images/{i:07d}.jpg" for i in range(count)]
+
+
+def _cleanup(folder: str) -> None:
+    with session_factory() as session:
+        session.execute(delete(DatasetOrm).where(DatasetOrm.folder == folder))
+        session.commit()
+
+
+def bench_legacy(count: int) -> float:
+    folder = f"bench_{uuid.uuid4().hex[:12]}"
+    try:
+        started = time.perf_counter()
+        for path in _paths(folder, count):
+            SyncOrm.insert_data({"train_folder": folder, "path": path})
+        return time.perf_counter() - started
+    finally:
+        _cleanup(folder)
+
+
+def bench_bulk(count: int, batch_size: int) -> tuple[float, float]:
+    """(первая индексация, повторная индексация тех же путей — все конфликты)."""
+    folder = f"bench_{uuid.uuid4().hex[:12]}"
+    paths = _paths(folder, count)
+    try:
+        started = time.perf_counter()
+        inserted = SyncOrm.insert_data_bulk(folder, paths, batch_size=batch_size)
+        first = time.perf_counter() - started
+        assert inserted == count, (inserted, count)
+        started = time.perf_counter()
+        assert SyncOrm.insert_data_bulk(folder, paths, batch_size=batch_size) == 0
+        return first, time.perf_counter() - started
+    finally:
+        _cleanup(folder)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--files", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--batch-size", type=int, default=INSERT_BATCH_SIZE)
+    parser.add_argument(
+        "--legacy-max",
+        type=int,
+        default=10_000,
+        help="не замерять insert_data на папках больше этого числа файлов",
+    )
+    args = parser.parse_args()
+
+    SyncOrm.create_tables()
+    print(f"{'файлов':>8} | {'insert_data':>18} | {'insert_data_bulk':>18} | {'повтор bulk':>12} | ускорение")
+    for count in args.files:
+        legacy = bench_legacy(count) if count <= args.legacy_max else None
+        bulk, repeat = bench_bulk(count, args.batch_size)
+        legacy_cell = f"{legacy:7.2f} с {count / legacy:7.0f}/с" if legacy else f"{'—':>18}"
+        speedup = f"{legacy / bulk:6.1f}x" if legacy else "—"
+        print(
+            f"{count:>8} | {legacy_cell} | {bulk:7.2f} с {count / bulk:7.0f}/с | "
+            f"{repeat:9.2f} с | {speedup}"
+        )
+
+
+if __name__ == "__main__":
+    main()
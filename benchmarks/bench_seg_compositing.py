@@ -0,0 +1,94 @@
+"""
+Сравнение наложения масок сегментации: прежний цикл по маскам и ml.compositing.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_seg_compositing --instances 40 --height 1080 --width 1920
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from ml.compositing import blend_overlay, iter_instance_masks, resize_masks
+
+PALETTE = np.array(
+    [
+        (255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (0, 255, 255),
+        (255, 0, 255), (192, 192, 192), (128, 128, 128), (128, 0, 0), (128, 128, 0),
+    ],
+    dtype=np.uint8,
+)
+
+
+def legacy(image_orig, masks, classes):
+    """Цикл из Model._process_image_seg до векторизации (без записи файлов)."""
+    h_or, w_or = image_orig.shape[:2]
+    colors = [tuple(int(c) for c in color) for color in PALETTE]
+    image = Image.fromarray(image_orig)
+    image = image.resize((640, 640))
+    for i, mask in enumerate(masks):
+        mask = Image.fromarray((mask * 255).astype(np.uint8))
+        mask_resized = mask.resize((w_or, h_or))
+        mask_resized_np = np.array(mask_resized)
+        color = colors[int(classes[i]) % len(colors)]
+        color_mask = np.zeros((h_or, w_or, 3), dtype=np.uint8)
+        color_mask[mask_resized_np > 0] = color
+        Image.fromarray(color_mask)
+        image_orig = np.array(image_orig).astype(np.float32)
+        blended_image = image_orig * 1.0 + color_mask * 0.5
+        image_orig = np.clip(blended_image, 0, 255).astype(np.uint8)
+    return image_orig
+
+
+def vectorized(image_orig, masks, classes):
+    h_or, w_or = image_orig.shape[:2]
+    resized = resize_masks(torch.from_numpy(masks), h_or, w_or)
+    for color_mask in iter_instance_masks(resized, classes, PALETTE):
+        Image.fromarray(color_mask)
+    return blend_overlay(image_orig, resized, classes, PALETTE)
+
+
+def _synthetic(instances, height, width, mask_size, rng):
+    image = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    masks = np.zeros((instances, mask_size, mask_size), dtype=np.float32)
+    for mask in masks:
+        y, x = rng.integers(0, mask_size - 64, size=2)
+        h, w = rng.integers(16, 64, size=2)
+        mask[y : y + h, x : x + w] = 1.0
+    classes = rng.integers(0, len(PALETTE), size=instances).astype(np.float32)
+    return image, masks, classes
+
+
+def _best_of(fn, repeats, *args):
+    best = float("inf")
+    out = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        out = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--instances", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--mask-size", type=int, default=640)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'instances':>9} {'legacy, s':>10} {'vectorized, s':>14} {'speedup':>8} {'max |diff|':>11}")
+    for n in args.instances:
+        image, masks, classes = _synthetic(n, args.height, args.width, args.mask_size, rng)
+        t_old, out_old = _best_of(legacy, args.repeats, image, masks, classes)
+        t_new, out_new = _best_of(vectorized, args.repeats, image, masks, classes)
+        diff = int(np.abs(out_old.astype(np.int16) - out_new.astype(np.int16)).max())
+        print(f"{n:>9} {t_old:>10.3f} {t_new:>14.3f} {t_old / t_new:>7.1f}x {diff:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -87,6 +87,14 @@ export async function listDriveFolders(
   return res.json();
 }
 
+/** Архивы, которые принимает backend (zip, tar, tar.gz, tar.zst). */
+export const ARCHIVE_ACCEPT = ".zip,.tar,.tar.gz,.tgz,.tar.zst,.tzst";
+
+export function isArchiveName(name: string): boolean {
+  const lower = name.toLowerCase();
+  return ARCHIVE_ACCEPT.split(",").some((ext) => lower.endsWith(ext));
+}
+
 export async function uploadDataset(file: File): Promise<UploadResponse> {
   const form = new FormData();
   form.append("file", file);
@@ -1,6 +1,11 @@
 import { useState, useEffect, useCallback } from "react";
 import { Link, useSearchParams, useNavigate } from "react-router-dom";
-import { listModels, startInference, type ModelListItem } from "../api";
+import {
+  ARCHIVE_ACCEPT,
+  listModels,
+  startInference,
+  type ModelListItem,
+} from "../api";
 import Card from "../components/ui/Card";
 import Button from "../components/ui/Button";
 import PageHeader from "../components/ui/PageHeader";
@@ -189,12 +194,12 @@ export default function Inference() {
                 fontSize: "0.9rem",
               }}
             >
-              ZIP с изображениями
+              Архив с изображениями (zip, tar, tar.gz, tar.zst)
             </label>
             <input
               id="infer-zip"
               type="file"
-              accept=".zip"
+              accept={ARCHIVE_ACCEPT}
               disabled={loading}
               onChange={(e) => setFile(e.target.files?.[0] || null)}
             />
@@ -1,6 +1,7 @@
 import { useState, useEffect } from "react";
 import { Link, useSearchParams, useNavigate } from "react-router-dom";
 import {
+  ARCHIVE_ACCEPT,
   getModelDownloadUrl,
   listModels,
   retrainDataset,
@@ -369,7 +370,7 @@ export default function Models() {
               color: "var(--text-muted)",
             }}
           >
-            ZIP с новыми данными (структура с папкой{" "}
+            Архив с новыми данными (структура с папкой{" "}
             <code style={{ fontFamily: "var(--font-mono)", fontSize: "12px" }}>dataset</code>
             ) будет слит с существующим проектом.
           </p>
@@ -427,7 +428,7 @@ export default function Models() {
             })()}
             <input
               type="file"
-              accept=".zip"
+              accept={ARCHIVE_ACCEPT}
               onChange={(e) => setRetrainFile(e.target.files?.[0] || null)}
               disabled={retrainBusy}
               style={{ marginBottom: "var(--space-3)", fontSize: "14px" }}
@@ -1,6 +1,8 @@
 import { useState, useCallback } from "react";
 import { Link } from "react-router-dom";
 import {
+  ARCHIVE_ACCEPT,
+  isArchiveName,
   uploadDataset,
   startJobFromDrive,
   listDriveFolders,
@@ -90,7 +92,7 @@ export default function Upload() {
     e.preventDefault();
     setDragActive(false);
     const f = e.dataTransfer.files?.[0];
-    if (f?.name.toLowerCase().endsWith(".zip")) setFile(f);
+    if (f && isArchiveName(f.name)) setFile(f);
   }, []);
 
   const onDragOver = useCallback((e: React.DragEvent) => {
@@ -119,7 +121,7 @@ export default function Upload() {
             setResult(null);
           }}
         >
-          ZIP-архив
+          Архив
         </button>
         <button
           type="button"
@@ -147,7 +149,7 @@ export default function Upload() {
                   fontSize: "0.9rem",
                 }}
               >
-                Выберите или перетащите ZIP-архив
+                Выберите или перетащите архив (zip, tar, tar.gz, tar.zst)
               </label>
               <div
                 className={`drop-zone ${dragActive ? "drop-zone--active" : ""}`}
@@ -159,7 +161,7 @@ export default function Upload() {
                 <input
                   id="file"
                   type="file"
-                  accept=".zip"
+                  accept={ARCHIVE_ACCEPT}
                   onChange={(e) => setFile(e.target.files?.[0] || null)}
                   disabled={loading}
                   style={{ display: "none" }}
@@ -170,7 +172,7 @@ export default function Upload() {
                   </p>
                 ) : (
                   <p style={{ margin: 0, color: "var(--text-muted)" }}>
-                    Перетащите ZIP сюда или нажмите для выбора
+                    Перетащите архив сюда или нажмите для выбора
                   </p>
                 )}
               </div>
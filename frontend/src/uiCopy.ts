@@ -28,11 +28,11 @@ export const labels = {
   projectIdField: "ID проекта",
   projectIdPlaceholder: "Вставьте ID проекта",
   uploadPageDesc:
-    "Загрузите датасет (ZIP или папка Google Drive) и запустите обучение. После старта откройте страницу задач по кнопке ниже.",
+    "Загрузите датасет (архив или папка Google Drive) и запустите обучение. После старта откройте страницу задач по кнопке ниже.",
   uploadSuccessJobLabel: "Номер задачи (для страницы «Задачи»)",
   uploadSuccessProjectLabel: "ID проекта (модель, дообучение, ссылки)",
   inferencePageDesc:
-    "Загрузите ZIP с тестовыми изображениями. Когда задача завершится, на странице «Задачи» появится ссылка на архив с результатами.",
+    "Загрузите архив с тестовыми изображениями. Когда задача завершится, на странице «Задачи» появится ссылка на архив с результатами.",
   pickModel: "Выберите модель",
   copyProjectId: "Копировать ID проекта",
 } as const;
@@ -1,11 +1,19 @@
+import hashlib
+import logging
 import os
-import shutil
+import random
+import time
 from tqdm import tqdm
 
+import torch
+from backend.dataset.materialize import materialize
+from ml.parallel import POOL_START_ERRORS, make_process_pool, parse_workers
 from ml.quiet import tqdm_disable
 from PIL import Image
 from torchvision import transforms
 
+logger = logging.getLogger(__name__)
+
 augment_transform = transforms.Compose([
     transforms.RandomHorizontalFlip(),
     transforms.RandomVerticalFlip(),
@@ -18,7 +26,88 @@ augment_transform = transforms.Compose([
     transforms.GaussianBlur(kernel_size=(5, 9), sigma=(0.1, 2.0)),
 ])
 
-def save_with_augmentations(files, source_dir, dest_dir, class_name, desc, augment_factor=0):
+def image_seed(seed: int, class_name: str, file: str) -> int:
+    """Seed аугментаций одного изображения: не зависит от порядка обработки и числа процессов."""
+    digest = hashlib.sha256(f"{seed}|{class_name}|{file}".encode()).digest()
+    return int.from_bytes(digest[:8], "little") >> 1
+
+
+def augment_image(job) -> int:
+    """
+    Аугментированные копии одного изображения: job = (путь к оригиналу, каталог класса,
+    имя файла, число копий, seed). Возвращает число сохранённых копий.
+    Копия пишется во временный файл и подменяет путь через os.replace: при SPLIT_MODE=link
+    файлы каталога класса — жёсткие ссылки на оригиналы, и запись поверх существующего
+    пути испортила бы исходный датасет.
+    """
+    source_path, class_dir, file, augment_factor, seed = job
+    random.seed(seed)
+    torch.manual_seed(seed)
+    image = Image.open(source_path).convert("RGB")
+    for i in range(augment_factor):
+        target = os.path.join(class_dir, f"aug{i}_{file}")
+        tmp = os.path.join(class_dir, f".tmp{i}_{file}")
+        augment_transform(image).save(tmp)
+        os.replace(tmp, target)
+    return augment_factor
+
+
+def _init_augment_worker() -> None:
+    # Параллелизм — процессами: torch внутри процесса в один поток
+    torch.set_num_threads(1)
+
+
+def augmentation_jobs(files, source_dir, dest_dir, class_name, augment_factor, seed=42):
+    """Задания augment_image для файлов класса."""
+    if not augment_factor:
+        return []
+    return [
+        (
+            os.path.join(source_dir, file),
+            os.path.join(dest_dir, class_name),
+            file,
+            augment_factor,
+            image_seed(seed, class_name, file),
+        )
+        for file in files
+    ]
+
+
+def augment_files(jobs, desc="augmentation") -> None:
+    """
+    Выполнить задания аугментации. При AUGMENT_WORKERS > 1 или auto (по умолчанию)
+    изображения распределяются по пулу процессов; если пул не запускается
+    (например, в daemon-процессе Celery), выполняются последовательно.
+    Результат одинаков при любом числе процессов: seed задан на изображение.
+    """
+    if not jobs:
+        return
+    started = time.perf_counter()
+    workers = parse_workers(os.environ.get("AUGMENT_WORKERS", "auto"), len(jobs))
+    produced = None
+    if workers > 1:
+        try:
+            with make_process_pool(workers, initializer=_init_augment_worker) as pool:
+                chunksize = max(1, min(32, len(jobs) // (workers * 4)))
+                results = pool.map(augment_image, jobs, chunksize=chunksize)
+                produced = sum(tqdm(results, total=len(jobs), desc=desc, disable=tqdm_disable()))
+        except POOL_START_ERRORS as e:
+            logger.warning("Аугментация: пул процессов недоступен (%s), выполняется последовательно", e)
+            workers = 1
+    if produced is None:
+        produced = sum(augment_image(job) for job in tqdm(jobs, desc=desc, disable=tqdm_disable()))
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    logger.info(
+        "Аугментация: %d изображений, %d копий, процессов %d, %.1f с, %.1f изобр./с",
+        len(jobs),
+        produced,
+        workers,
+        elapsed,
+        produced / elapsed,
+    )
+
+
+def save_with_augmentations(files, source_dir, dest_dir, class_name, desc, augment_factor=0, mode="copy", seed=42):
     """
     Сохранение файлов с аугментацией изображений для увеличения количества примеров класса.
 
@@ -29,20 +118,14 @@ def save_with_augmentations(files, source_dir, dest_dir, class_name, desc, augme
         class_name (str): Имя класса, используемое для создания поддиректории в `dest_dir`.
         desc (str): Описание для прогресс-бара tqdm.
         augment_factor (int): Количество раз, которое нужно применить аугментацию к каждому изображению.
+        mode (str): Размещение оригиналов: copy | link | list (см. backend.dataset.materialize).
+        seed (int): Базовый seed аугментаций (см. image_seed).
     Возвращает:
         None. Функция сохраняет изображения с аугментацией в указанной директории.
     """
     os.makedirs(os.path.join(dest_dir, class_name), exist_ok=True)
-    
+
     for file in tqdm(files, desc=desc, disable=tqdm_disable()):
-        original_image_path = os.path.join(source_dir, file)
-        save_path = os.path.join(dest_dir, class_name, file)
-            
-        shutil.copy(original_image_path, save_path)
-
-        if augment_factor:
-            image = Image.open(original_image_path).convert("RGB")
-            for i in range(augment_factor):
-                augmented_image = augment_transform(image)
-                augmented_save_path = os.path.join(dest_dir, class_name, f"{i}_{file}")
-                augmented_image.save(augmented_save_path)
\ No newline at end of file
+        materialize(os.path.join(source_dir, file), os.path.join(dest_dir, class_name, file), mode)
+
+    augment_files(augmentation_jobs(files, source_dir, dest_dir, class_name, augment_factor, seed), desc=desc)
@@ -1,38 +1,214 @@
 from ultralytics import YOLO
 from torch import device
 from torch import cuda
+from torch import set_num_threads
+from sqlalchemy.exc import SQLAlchemyError
+from datetime import timedelta
 import shutil
-import json
 import hashlib
+import logging
+import math
 import os
+import tempfile
+import time
+
+from backend.db.orm import SyncOrm
+from ml.fingerprint import dataset_fingerprint
+from ml.image_cache import cached_dataset, raw_cache
+from ml.parallel import POOL_START_ERRORS, make_process_pool, parse_workers
+from ml.resources import ResourceProfile, get_profile
+from ml.sampling import trainer_for
+
+logger = logging.getLogger(__name__)
 
 # Сетка размеров: 6 точек вместо 11 (640..960 шаг 64)
 IMGSZ_GRID = list(range(640, 960 + 1, 64))  # [640, 704, 768, 832, 896, 960]
-CACHE_FILE = ".check_imgsz_cache.json"
+
+# Successive halving: после каждой ступени остаётся 1/HALVING_ETA кандидатов,
+# бюджет (эпохи и доля train) растёт в HALVING_ETA раз до полного.
+HALVING_ETA = 3
+HALVING_MIN_FRACTION = 0.25
 
 
-def _dataset_hash(path_dataset: str, model_type: str) -> str:
-    """Хеш датасета и типа модели для кэширования."""
-    key = f"{os.path.abspath(path_dataset)}|{model_type}"
+def _cache_key(fingerprint: str, model_type: str) -> str:
+    """Ключ кэша: отпечаток содержимого разбитого датасета и тип модели."""
+    key = f"{fingerprint}|{model_type}"
     return hashlib.sha256(key.encode()).hexdigest()
 
 
-def _load_cache() -> dict:
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, encoding="utf-8") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pass
-    return {}
+def _cache_get(cache_key: str) -> int | None:
+    try:
+        return SyncOrm.select_imgsz_cache(cache_key)
+    except SQLAlchemyError as e:
+        logger.warning("check_imgsz: кэш недоступен: %s", e)
+        return None
 
 
-def _save_cache(cache: dict) -> None:
+def _cache_put(cache_key: str, model_type: str, imgsz: int) -> None:
+    max_entries = int(os.environ.get("IMGSZ_CACHE_MAX_ENTRIES", "1000"))
+    max_age = timedelta(days=float(os.environ.get("IMGSZ_CACHE_MAX_AGE_DAYS", "180")))
     try:
-        with open(CACHE_FILE, "w", encoding="utf-8") as f:
-            json.dump(cache, f, indent=2)
-    except IOError:
-        pass
+        SyncOrm.upsert_imgsz_cache(cache_key, model_type, imgsz)
+        SyncOrm.evict_imgsz_cache(max_entries, max_age)
+    except SQLAlchemyError as e:
+        logger.warning("check_imgsz: не удалось записать кэш: %s", e)
+
+
+def _search_strategy() -> str:
+    """Стратегия перебора: halving (по умолчанию) или grid (полный прогон каждой точки)."""
+    strategy = os.environ.get("IMGSZ_SEARCH_STRATEGY", "halving").strip().lower()
+    return strategy if strategy in ("halving", "grid") else "halving"
+
+
+def _evaluate(
+    path_dataset: str,
+    model_type: str,
+    img_size: int,
+    epochs: int,
+    fraction: float,
+    project: str,
+    parallel: int = 1,
+) -> float:
+    """
+    Обучить модель с заданным imgsz и бюджетом, вернуть метрику на val.
+    Каждый прогон пишет в свой project, поэтому прогоны можно запускать параллельно;
+    при parallel > 1 прогон получает 1/parallel ядер и памяти worker.
+    """
+    profile = get_profile()
+    workers, threads = _trial_resources(profile, parallel)
+    set_num_threads(threads)
+    model = YOLO(model_type)
+    model.train(
+        data=path_dataset,
+        imgsz=img_size,
+        epochs=epochs,
+        fraction=fraction,
+        project=project,
+        batch=profile.batch_for(img_size, memory_share=1 / parallel),
+        workers=workers,
+        device=device("cuda:0" if cuda.is_available() else "cpu"),
+        cache=raw_cache(),
+        verbose=False,
+        trainer=trainer_for(path_dataset),
+    )
+    metrics = model.val()
+    if "cls" in model_type:
+        score = float(metrics.top1)
+    else:
+        score = float(metrics.box.map)
+    del model
+    if cuda.is_available():
+        cuda.empty_cache()
+    return score
+
+
+def _trial_resources(profile: ResourceProfile, parallel: int) -> tuple[int, int]:
+    """(dataloader workers, потоки torch) на один прогон, чтобы прогоны не делили ядра."""
+    if parallel == 1:
+        return profile.workers, profile.threads
+    per_trial = max(1, profile.cpus // parallel)
+    loader_workers = min(profile.workers, per_trial // 2)
+    return loader_workers, max(1, per_trial - loader_workers)
+
+
+def _evaluate_many(
+    path_dataset: str,
+    model_type: str,
+    sizes: list[int],
+    epochs: int,
+    fraction: float,
+    search_root: str,
+    rung: int,
+) -> dict[int, float]:
+    """
+    Метрики для списка imgsz. При IMGSZ_SEARCH_WORKERS > 1 (или auto) прогоны идут
+    в пуле процессов; если пул не запускается, прогоны выполняются последовательно.
+    """
+    projects = {size: os.path.join(search_root, f"rung{rung}_imgsz{size}") for size in sizes}
+    parallel = parse_workers(
+        os.environ.get("IMGSZ_SEARCH_WORKERS"), len(sizes), min_cpus_per_worker=4
+    )
+    if parallel > 1:
+        pool = None
+        try:
+            pool = make_process_pool(parallel)
+            futures = {
+                size: pool.submit(
+                    _evaluate,
+                    path_dataset,
+                    model_type,
+                    size,
+                    epochs,
+                    fraction,
+                    projects[size],
+                    parallel,
+                )
+                for size in sizes
+            }
+        except POOL_START_ERRORS as e:
+            logger.warning("check_imgsz: пул процессов недоступен (%s), перебор последовательно", e)
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            pool = None
+        if pool is not None:
+            # Ошибки самих прогонов пробрасываются, а не считаются сбоем пула
+            with pool:
+                return {size: future.result() for size, future in futures.items()}
+    return {
+        size: _evaluate(path_dataset, model_type, size, epochs, fraction, projects[size])
+        for size in sizes
+    }
+
+
+def _grid_search(
+    path_dataset: str, model_type: str, epochs: int, search_root: str
+) -> dict[int, float]:
+    """Полный прогон каждой точки IMGSZ_GRID с бюджетом epochs."""
+    started = time.perf_counter()
+    scores = _evaluate_many(path_dataset, model_type, IMGSZ_GRID, epochs, 1.0, search_root, 0)
+    logger.info(
+        "check_imgsz: сетка, кандидатов %d, epochs=%d, %.1f с",
+        len(IMGSZ_GRID),
+        epochs,
+        time.perf_counter() - started,
+    )
+    return scores
+
+
+def _halving_search(
+    path_dataset: str, model_type: str, epochs: int, search_root: str
+) -> dict[int, float]:
+    """
+    Successive halving по IMGSZ_GRID.
+
+    На ступени i все выжившие кандидаты обучаются с бюджетом HALVING_ETA^-(R-1-i)
+    от полного (эпохи и доля train-выборки), дальше проходят лучшие
+    ceil(n / HALVING_ETA). Полный бюджет тратится только на последней ступени.
+    Возвращает метрики последней ступени.
+    """
+    candidates = list(IMGSZ_GRID)
+    rungs = max(1, math.ceil(math.log(len(candidates), HALVING_ETA)))
+    scores: dict[int, float] = {}
+    for rung in range(rungs):
+        budget = HALVING_ETA ** -(rungs - 1 - rung)
+        rung_epochs = max(1, round(epochs * budget))
+        fraction = max(HALVING_MIN_FRACTION, budget)
+        started = time.perf_counter()
+        scores = _evaluate_many(
+            path_dataset, model_type, candidates, rung_epochs, fraction, search_root, rung
+        )
+        logger.info(
+            "check_imgsz: ступень %d/%d, кандидатов %d, epochs=%d, fraction=%.2f, %.1f с",
+            rung + 1,
+            rungs,
+            len(candidates),
+            rung_epochs,
+            fraction,
+            time.perf_counter() - started,
+        )
+        keep = max(1, math.ceil(len(candidates) / HALVING_ETA))
+        candidates = sorted(candidates, key=lambda s: scores[s], reverse=True)[:keep]
+    return scores
 
 
 def check_imgsz(
@@ -40,6 +216,7 @@ def check_imgsz(
     model_type: str,
     epochs: int = 5,
     use_cache: bool = True,
+    strategy: str | None = None,
 ) -> int:
     """
     Поиск оптимального размера изображения на конкретном датасете для тренировки YOLO.
@@ -47,47 +224,44 @@ def check_imgsz(
     Параметры:
         path_dataset (str): Путь до датасета.
         model_type (str): Модель для обучения (классификация или сегментация).
-        epochs (int): Количество эпох на каждый размер (по умолчанию 5).
-        use_cache (bool): Использовать кэш по хешу датасета (по умолчанию True).
+        epochs (int): Полный бюджет эпох на размер (по умолчанию 5).
+        use_cache (bool): Использовать общий кэш по отпечатку содержимого датасета (по умолчанию True).
+        strategy (str, optional): 'halving' или 'grid'; по умолчанию из IMGSZ_SEARCH_STRATEGY.
 
     Возвращает:
         int: Оптимальный размер imgsz.
     """
-    cache_key = _dataset_hash(path_dataset, model_type) if use_cache else None
+    fingerprint = dataset_fingerprint(path_dataset)
+    cache_key = _cache_key(fingerprint, model_type) if use_cache else None
 
     if use_cache:
-        cache = _load_cache()
-        if cache_key in cache:
-            return int(cache[cache_key])
-
-    context_imgsz = {}
-    for img_size in IMGSZ_GRID:
-        model = YOLO(model_type)
-        model.train(
-            data=path_dataset,
-            imgsz=img_size,
-            epochs=epochs,
-            project="train_classify",
-            batch=4,
-            workers=2,
-            device=device("cuda:0" if cuda.is_available() else "cpu"),
-            verbose=False,
-        )
-        metrics = model.val()
-        if "cls" in model_type:
-            context_imgsz[img_size] = metrics.top1
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            logger.info("check_imgsz: imgsz=%d из кэша", cached)
+            return cached
+
+    strategy = strategy or _search_strategy()
+    started = time.perf_counter()
+    # Все прогоны читают изображения, уже уменьшенные до наибольшего кандидата
+    path_dataset = cached_dataset(path_dataset, max(IMGSZ_GRID))
+    search_root = tempfile.mkdtemp(prefix="imgsz_search_", dir=os.getcwd())
+    try:
+        if strategy == "grid":
+            context_imgsz = _grid_search(path_dataset, model_type, epochs, search_root)
         else:
-            context_imgsz[img_size] = metrics.box.map
-        del model
-        if cuda.is_available():
-            cuda.empty_cache()
+            context_imgsz = _halving_search(path_dataset, model_type, epochs, search_root)
+    finally:
+        shutil.rmtree(search_root, ignore_errors=True)
 
     result = int(max(context_imgsz.items(), key=lambda x: x[1])[0])
-    shutil.rmtree("train_classify", ignore_errors=True)
+    logger.info(
+        "check_imgsz: стратегия %s, imgsz=%d, всего %.1f с",
+        strategy,
+        result,
+        time.perf_counter() - started,
+    )
 
     if use_cache:
-        cache = _load_cache()
-        cache[cache_key] = result
-        _save_cache(cache)
+        _cache_put(cache_key, model_type, result)
 
-    return result
\ No newline at end of file
+    return result
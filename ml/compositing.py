@@ -0,0 +1,77 @@
+"""
+Наложение масок сегментации на изображение.
+
+Маски масштабируются пачками по RESIZE_CHUNK, цветная подложка накапливается в одном
+буфере (H, W, 3) по палитре классов, смешивание — один раз на изображение. Память
+не растёт с числом экземпляров сверх bool-масок.
+"""
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# Прежний цикл переводил маску в uint8 (mask * 255), масштабировал её PIL (bicubic:
+# два прохода, ширина, затем высота, с округлением до uint8 после каждого) и считал
+# пикселем маски всё, что > 0. Те же проходы и округление повторяются здесь, поэтому
+# граница маски совпадает с прежней попиксельно.
+MASK_THRESHOLD = 0
+# Масок в одном interpolate: float-буфер (RESIZE_CHUNK, H, W) вместо (N, H, W)
+RESIZE_CHUNK = 8
+
+
+def _resize_pass(x: torch.Tensor, height: int, width: int) -> torch.Tensor:
+    """Один проход bicubic PIL (a = -0.5, сглаживание при уменьшении) с округлением до uint8."""
+    x = F.interpolate(x, size=(height, width), mode="bicubic", align_corners=False, antialias=True)
+    # PIL округляет половину вверх, torch.round — к чётному
+    return torch.floor(x + 0.5).clamp_(0, 255)
+
+
+def resize_masks(masks: torch.Tensor, height: int, width: int) -> np.ndarray:
+    """Маски модели (N, h, w) → bool-массив (N, height, width)."""
+    out = np.empty((masks.shape[0], height, width), dtype=bool)
+    for start in range(0, masks.shape[0], RESIZE_CHUNK):
+        chunk = masks[start : start + RESIZE_CHUNK]
+        resized = torch.floor(chunk[None].float() * 255).clamp_(0, 255)
+        if width != resized.shape[-1]:
+            resized = _resize_pass(resized, resized.shape[-2], width)
+        if height != resized.shape[-2]:
+            resized = _resize_pass(resized, height, width)
+        out[start : start + len(chunk)] = (resized[0] > MASK_THRESHOLD).cpu().numpy()
+    return out
+
+
+def _instance_colors(classes: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    return palette[classes.astype(np.int64) % len(palette)]
+
+
+def iter_instance_masks(masks: np.ndarray, classes: np.ndarray, palette: np.ndarray):
+    """
+    Цветная маска каждого экземпляра (H, W, 3) uint8.
+    Буфер один на изображение: сохраните или скопируйте его до следующей итерации.
+    """
+    buffer = np.empty(masks.shape[1:] + (3,), dtype=np.uint8)
+    for mask, color in zip(masks, _instance_colors(classes, palette)):
+        buffer.fill(0)
+        buffer[mask] = color
+        yield buffer
+
+
+def blend_overlay(
+    image: np.ndarray,
+    masks: np.ndarray,
+    classes: np.ndarray,
+    palette: np.ndarray,
+    alpha: float = 0.5,
+) -> np.ndarray:
+    """
+    image + alpha * сумма цветных масок, с обрезкой до [0, 255].
+    Перекрытия суммируются, как и при последовательном наложении масок.
+    """
+    if masks.shape[0] == 0:
+        return image
+    overlay = np.zeros(masks.shape[1:] + (3,), dtype=np.float32)
+    for mask, color in zip(masks, _instance_colors(classes, palette).astype(np.float32)):
+        overlay[mask] += color
+    overlay *= alpha
+    overlay += image
+    np.clip(overlay, 0, 255, out=overlay)
+    return overlay.astype(np.uint8)
@@ -0,0 +1,97 @@
+"""Отпечаток содержимого разбитого датасета (data_root) для кэшей между задачами."""
+import hashlib
+import json
+import os
+from collections import Counter
+
+import yaml
+
+SPLITS = ("train", "val", "test")
+
+
+def _split_roots(path_dataset: str) -> list[tuple[str, str]]:
+    """
+    [(split, корень выборки)] для dataset.yaml (сегментация) или каталога data_root
+    (классификация). Для сегментации корень — родитель images/, чтобы labels/ тоже попали;
+    для списка изображений (SPLIT_MODE=list) — путь к .txt.
+    """
+    if os.path.isfile(path_dataset):
+        with open(path_dataset, encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        base = data.get("path") or os.path.dirname(os.path.abspath(path_dataset))
+        roots = []
+        for split in SPLITS:
+            entry = data.get(split)
+            if not entry:
+                continue
+            source = os.path.normpath(os.path.join(base, entry))
+            if os.path.basename(source) == "images":
+                source = os.path.dirname(source)
+            roots.append((split, source))
+        return roots
+    return [
+        (split, os.path.join(path_dataset, split))
+        for split in SPLITS
+        if os.path.isdir(os.path.join(path_dataset, split))
+    ]
+
+
+def _iter_list_files(list_path: str):
+    """Изображения из списка выборки и их разметка (images/ → labels/), как в каталоге выборки."""
+    base = os.path.dirname(list_path)
+    with open(list_path, encoding="utf-8") as f:
+        for line in f:
+            image = line.strip()
+            if not image:
+                continue
+            image = os.path.normpath(os.path.join(base, image))
+            name = os.path.basename(image)
+            yield f"images/{name}", image
+            label_name = os.path.splitext(name)[0] + ".txt"
+            label = os.path.join(os.path.dirname(os.path.dirname(image)), "labels", label_name)
+            if os.path.isfile(label):
+                yield f"labels/{label_name}", label
+
+
+def iter_split_files(path_dataset: str):
+    """Генератор (split, относительный путь внутри выборки, абсолютный путь) по всем файлам."""
+    for split, root in _split_roots(path_dataset):
+        if os.path.isfile(root):
+            for rel, full in _iter_list_files(root):
+                yield split, rel, full
+            continue
+        for dirpath, _, files in os.walk(root):
+            for name in files:
+                full = os.path.join(dirpath, name)
+                yield split, os.path.relpath(full, root).replace(os.sep, "/"), full
+
+
+def _label_classes(path: str) -> list[str]:
+    classes = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if parts:
+                classes.append(parts[0])
+    return classes
+
+
+def dataset_fingerprint(path_dataset: str) -> str:
+    """
+    sha256 по именам файлов выборок, их размерам и гистограмме классов.
+    Не зависит от расположения data_root, поэтому совпадает у разных задач с теми же данными.
+    """
+    entries = []
+    histogram: Counter = Counter()
+    for split, rel, full in iter_split_files(path_dataset):
+        entries.append(f"{split}|{rel}|{os.path.getsize(full)}")
+        if rel.startswith("labels/") and rel.endswith(".txt"):
+            histogram.update(_label_classes(full))
+        elif "/" in rel and not rel.startswith(("images/", "labels/")):
+            histogram[rel.split("/", 1)[0]] += 1
+    digest = hashlib.sha256()
+    for entry in sorted(entries):
+        digest.update(entry.encode())
+        digest.update(b"\n")
+    digest.update(json.dumps(dict(sorted(histogram.items()))).encode())
+    return digest.hexdigest()
@@ -0,0 +1,257 @@
+"""
+Кэш изображений, уменьшенных до наибольшего нужного размера, общий для перебора imgsz,
+обучения и дообучения.
+
+Кэш выключен по умолчанию (IMAGE_CACHE=1 включает): уменьшение (LANCZOS) и повторное
+сжатие JPEG (качество 95) меняют изображения, на которых обучается модель.
+
+Уменьшенные изображения хранятся по содержимому (blobs/<sha256[:2]>/<sha256>-<сторона><ext>),
+поэтому неизменённые файлы переиспользуются между версиями датасета. Для каждого
+разбитого датасета собирается представление views/<ключ>-<сторона>/ из hardlink на blobs
+в той же структуре train/val (разметка — hardlink на исходные файлы), и Ultralytics
+обучается на нём. Ключ представления — хэш sha256 всех файлов выборок с их путями,
+поэтому изменённый файл того же размера даёт новое представление.
+С IMAGE_CACHE_RAW=1 Ultralytics дополнительно хранит декодированные массивы (.npy)
+рядом с изображениями представления (cache="disk").
+
+Вытеснение — LRU по представлениям при превышении IMAGE_CACHE_MAX_MB; blob удаляется,
+когда на него не ссылается ни одно представление (st_nlink == 1).
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+from PIL import Image, ImageOps
+
+from backend.dataset.materialize import materialize
+from ml.fingerprint import iter_split_files
+from ml.parallel import available_cpus
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = ".image_cache"
+COMPLETE_MARKER = ".complete"
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff"}
+JPEG_QUALITY = 95
+# Представления, использованные недавно, не вытесняются: на них может идти обучение
+ACTIVE_GRACE_SECONDS = 6 * 3600
+
+
+def cache_enabled() -> bool:
+    return os.environ.get("IMAGE_CACHE", "").lower() in ("1", "true", "yes")
+
+
+def raw_cache() -> str | bool:
+    """Значение cache для YOLO.train(): 'disk' при IMAGE_CACHE_RAW=1."""
+    enabled = os.environ.get("IMAGE_CACHE_RAW", "").lower() in ("1", "true", "yes")
+    return "disk" if enabled and cache_enabled() else False
+
+
+def _cache_root() -> str:
+    return os.environ.get(
+        "IMAGE_CACHE_DIR", os.path.join(os.environ.get("ML_DATA_PATH", "/data"), CACHE_DIR)
+    )
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _content_key(path_dataset: str, files: list[tuple[str, str, str]]) -> tuple[str, dict[str, str]]:
+    """
+    Ключ представления по содержимому: sha256 от путей и sha256 всех файлов выборок
+    (и файлов описания датасета). Возвращает (ключ, {абсолютный путь: sha256}).
+    """
+    with ThreadPoolExecutor(max_workers=available_cpus()) as pool:
+        hashes = dict(zip((full for _, _, full in files), pool.map(_file_sha256, (full for _, _, full in files))))
+    digest = hashlib.sha256()
+    for split, rel, full in sorted(files):
+        digest.update(f"{split}/{rel}\0{hashes[full]}\n".encode("utf-8"))
+    if os.path.isfile(path_dataset):
+        digest.update(_file_sha256(path_dataset).encode("ascii"))
+    else:
+        for name in sorted(os.listdir(path_dataset)):
+            source = os.path.join(path_dataset, name)
+            if os.path.isfile(source):
+                digest.update(f"{name}\0{_file_sha256(source)}\n".encode("utf-8"))
+    return digest.hexdigest(), hashes
+
+
+def _split_files(path_dataset: str) -> list[tuple[str, str, str]]:
+    # Кэши Ultralytics (labels.cache, .npy) относятся к исходному каталогу
+    return [
+        item for item in iter_split_files(path_dataset)
+        if not item[1].endswith((".cache", ".npy"))
+    ]
+
+
+def _blob(source: str, sha: str, blobs_dir: str, side: int) -> str:
+    """Путь blob для source (sha — sha256 файла); создаётся при отсутствии (уменьшение с учётом EXIF-поворота)."""
+    ext = os.path.splitext(source)[1].lower()
+    path = os.path.join(blobs_dir, sha[:2], f"{sha}-{side}{ext}")
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp", suffix=ext)
+    os.close(fd)
+    try:
+        with Image.open(source) as image:
+            oriented = ImageOps.exif_transpose(image)
+            if max(oriented.size) <= side and oriented is image:
+                # Уже не больше нужного и без поворота: blob — сам файл
+                shutil.copyfile(source, tmp)
+            else:
+                oriented.thumbnail((side, side), Image.Resampling.LANCZOS)
+                if oriented.mode not in ("RGB", "L") and ext in (".jpg", ".jpeg"):
+                    oriented = oriented.convert("RGB")
+                params = {"quality": JPEG_QUALITY} if ext in (".jpg", ".jpeg") else {}
+                oriented.save(tmp, format=image.format, **params)
+        os.replace(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
+    return path
+
+
+def _build_view(
+    path_dataset: str,
+    files: list[tuple[str, str, str]],
+    hashes: dict[str, str],
+    view_dir: str,
+    blobs_dir: str,
+    side: int,
+) -> None:
+    """Собрать представление во временном каталоге и атомарно переименовать в view_dir."""
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp_view_", dir=os.path.dirname(view_dir))
+    try:
+        def place(item):
+            split, rel, full = item
+            dest = os.path.join(tmp_dir, split, *rel.split("/"))
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if os.path.splitext(rel)[1].lower() in IMAGE_EXTS:
+                source = _blob(full, hashes[full], blobs_dir, side)
+            else:
+                source = full
+            materialize(source, dest, "link")
+
+        with ThreadPoolExecutor(max_workers=available_cpus()) as pool:
+            list(pool.map(place, files))
+
+        if os.path.isfile(path_dataset):
+            with open(path_dataset, encoding="utf-8") as f:
+                data = yaml.safe_load(f) or {}
+            splits = {split for split, _, _ in files}
+            data.update({split: f"{split}/images" for split in splits})
+            data["path"] = view_dir
+            with open(os.path.join(tmp_dir, "dataset.yaml"), "w", encoding="utf-8") as f:
+                yaml.dump(data, f, default_flow_style=None, allow_unicode=True)
+        else:
+            # Файлы верхнего уровня data_root (например, sampling.json)
+            for name in os.listdir(path_dataset):
+                source = os.path.join(path_dataset, name)
+                if os.path.isfile(source):
+                    shutil.copyfile(source, os.path.join(tmp_dir, name))
+        open(os.path.join(tmp_dir, COMPLETE_MARKER), "w").close()
+        try:
+            os.rename(tmp_dir, view_dir)
+        except OSError:
+            # Представление уже собрал другой процесс
+            if not os.path.exists(os.path.join(view_dir, COMPLETE_MARKER)):
+                raise
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def _tree_bytes(root: str, owned_only: bool = False) -> int:
+    """Размер файлов каталога; owned_only — без hardlink (blob и исходная разметка)."""
+    total = 0
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            st = os.stat(os.path.join(dirpath, name), follow_symlinks=False)
+            if not owned_only or st.st_nlink == 1:
+                total += st.st_size
+    return total
+
+
+def _collect_orphans(blobs_dir: str) -> int:
+    """Удалить blob без ссылок из представлений; недавние не трогать (их сейчас связывают)."""
+    freed = 0
+    for dirpath, _, names in os.walk(blobs_dir):
+        for name in names:
+            path = os.path.join(dirpath, name)
+            st = os.stat(path)
+            if st.st_nlink == 1 and time.time() - st.st_mtime > 60:
+                os.remove(path)
+                freed += st.st_size
+    return freed
+
+
+def evict(max_bytes: int, keep: str | None = None) -> None:
+    """LRU-вытеснение представлений (по времени использования) и blob без ссылок до max_bytes."""
+    root = _cache_root()
+    views_dir = os.path.join(root, "views")
+    blobs_dir = os.path.join(root, "blobs")
+    _collect_orphans(blobs_dir)
+    views = []
+    for name in os.listdir(views_dir) if os.path.isdir(views_dir) else []:
+        marker = os.path.join(views_dir, name, COMPLETE_MARKER)
+        if os.path.exists(marker):
+            views.append((os.path.getmtime(marker), os.path.join(views_dir, name)))
+    total = _tree_bytes(blobs_dir) + sum(_tree_bytes(path, owned_only=True) for _, path in views)
+    for used_at, path in sorted(views):
+        if total <= max_bytes:
+            break
+        if path == keep or time.time() - used_at < ACTIVE_GRACE_SECONDS:
+            continue
+        total -= _tree_bytes(path, owned_only=True)
+        shutil.rmtree(path, ignore_errors=True)
+        total -= _collect_orphans(blobs_dir)
+        logger.info("Кэш изображений: вытеснено представление %s", os.path.basename(path))
+
+
+def cached_dataset(path_dataset: str, side: int) -> str:
+    """
+    Путь для YOLO.train(data=...) — представление датасета из кэша (dataset.yaml для
+    сегментации, каталог для классификации). Если кэш не включён (IMAGE_CACHE=1) или
+    недоступен, возвращается исходный path_dataset.
+    """
+    if not cache_enabled():
+        return path_dataset
+    root = _cache_root()
+    try:
+        files = _split_files(path_dataset)
+        key, hashes = _content_key(path_dataset, files)
+        views_dir = os.path.join(root, "views")
+        os.makedirs(views_dir, exist_ok=True)
+        view_dir = os.path.join(views_dir, f"{key[:32]}-{side}")
+        marker = os.path.join(view_dir, COMPLETE_MARKER)
+        if os.path.exists(marker):
+            os.utime(marker)
+            logger.info("Кэш изображений: представление %s", os.path.basename(view_dir))
+        else:
+            started = time.perf_counter()
+            _build_view(path_dataset, files, hashes, view_dir, os.path.join(root, "blobs"), side)
+            logger.info(
+                "Кэш изображений: собрано представление %s (сторона %d) за %.1f с",
+                os.path.basename(view_dir),
+                side,
+                time.perf_counter() - started,
+            )
+        evict(int(float(os.environ.get("IMAGE_CACHE_MAX_MB", "10240")) * 2**20), keep=view_dir)
+    except (OSError, Image.DecompressionBombError) as e:
+        logger.warning("Кэш изображений недоступен (%s), обучение на исходных файлах", e)
+        return path_dataset
+    if os.path.isfile(path_dataset):
+        return os.path.join(view_dir, "dataset.yaml")
+    return view_dir
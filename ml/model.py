@@ -1,6 +1,12 @@
 from ultralytics import YOLO
-from ml.check_imgsz import check_imgsz
-from backend.integrations.google_drive_upload import upload_to_drive
+from ml.check_imgsz import IMGSZ_GRID, check_imgsz
+from ml.image_cache import cached_dataset, raw_cache
+from ml.registry import get_registry
+from ml.resources import get_profile
+from ml.compositing import blend_overlay, iter_instance_masks, resize_masks
+from ml.result_sink import DirectorySink, encode_image
+from ml.sampling import trainer_for
+from backend.integrations.google_drive_upload import DriveUploader, drive_upload_enabled
 from ml.seed import set_seed
 from PIL import Image
 import torch
@@ -45,8 +51,13 @@ class Model:
             (0, 128, 0), (128, 0, 128), (0, 128, 128), (0, 0, 128), (72, 61, 139),
             (47, 79, 79), (47, 79, 47), (0, 206, 209), (148, 0, 211), (255, 20, 147)
         ]
+        self.palette = np.array(self.colors, dtype=np.uint8)
         set_seed(self.random_seed)
 
+    def _train_data(self):
+        """Датасет для обучения: представление из кэша уменьшенных изображений (ml.image_cache)."""
+        return cached_dataset(self.path_dataset, max(max(IMGSZ_GRID), self.imgsz or 0))
+
     def train(self):
         """
         Запуск основного этапа обучения модели с параметрами по умолчанию.
@@ -66,62 +77,95 @@ class Model:
             )
 
         # Инициализация и запуск обучения модели
+        profile = get_profile()
         model = YOLO(self.model_type)
         model.train(
-            data=self.path_dataset,
-            epochs=1,
-            batch=4,
+            data=self._train_data(),
+            epochs=profile.epochs,
+            batch=profile.batch_for(self.imgsz),
             device=self.device,
-            workers=2,
+            workers=profile.workers,
             project=self.save_dir,
             imgsz=self.imgsz,
             seed=self.random_seed,
             verbose=False,
+            cache=raw_cache(),
+            trainer=trainer_for(self.path_dataset),
         )
 
         # Сохранение весов модели и результатов
         self._save_results()
 
-    def additional_train(self):
+    def additional_train(self, epochs=None):
         """
         Дополнительное обучение модели на новых данных.
         Результаты и веса копируются в указанную папку.
+        Параметры:
+            epochs (int, optional): число эпох; по умолчанию из профиля ресурсов (FINE_TUNE_EPOCHS).
         """
+        profile = get_profile()
         model = YOLO(self.path_model)
         model.train(
-            epochs=10,
-            data=self.path_dataset,
-            batch=4,
+            epochs=epochs or profile.fine_tune_epochs,
+            data=self._train_data(),
+            batch=profile.batch_for(self.imgsz),
             device=self.device,
-            workers=2,
+            workers=profile.workers,
             project=self.save_dir,
             imgsz=self.imgsz,
             seed=self.random_seed,
             verbose=False,
+            cache=raw_cache(),
+            trainer=trainer_for(self.path_dataset),
         )
         # Сохранение весов модели и результатов
         self._save_results()
 
-    def predict(self, task):
+    def predict(self, task, sink=None, uploader=None):
         """
         Параметры:
             task (str): тип задачи.
+            sink (optional): приёмник артефактов (ml.result_sink); по умолчанию каталог self.path_result.
+            uploader (DriveUploader, optional): загрузчик в Google Drive на весь прогон; если не
+                передан, создаётся на время вызова (когда загрузка в Drive не отключена).
         Проверка созданной модели на тестовых данных пользователя.
 
         Исключения:
             NoTestDataError: вызывается, если пользователь не предоставил тестовые изображения.
         """
-        # Очистка предыдущих результатов обработки для избежания ошибок, и создание "чистой" директории
-        shutil.rmtree(self.path_result, ignore_errors=True)
-        os.makedirs(self.path_result)
         if not os.listdir(self.path_test):
             raise(NoTestDataError())
+        if sink is None:
+            # Очистка предыдущих результатов обработки для избежания ошибок, и создание "чистой" директории
+            shutil.rmtree(self.path_result, ignore_errors=True)
+            os.makedirs(self.path_result)
+            sink = DirectorySink(self.path_result)
+        self.sink = sink
+        own_uploader = uploader is None and drive_upload_enabled()
+        self.uploader = DriveUploader() if own_uploader else uploader
+
+        try:
+            if task == 'сегментация':
+                self._process_image_seg(self.path_test)
+            elif task == 'классификация':           
+                self._process_image_cls(self.path_test)
+        finally:
+            if own_uploader:
+                self.uploader.close()
 
-        if task == 'сегментация':
-            os.makedirs(os.path.join(self.path_result, 'masks'))
-            self._process_image_seg(self.path_test)
-        elif task == 'классификация':           
-            self._process_image_cls(self.path_test)
+    def _emit(self, arcname: str, data: bytes):
+        """
+        Запись артефакта в приёмник и постановка копии в очередь загрузки в Google Drive (папка result задачи).
+        Параметры:
+            arcname (str): относительный путь в результатах, через '/'.
+            data (bytes): содержимое файла.
+        """
+        self.sink.write(arcname, data)
+        if self.uploader is None:
+            return
+        subdir, name = os.path.split(arcname)
+        drive_path = os.path.join(self.folder, 'result', *filter(None, subdir.split('/')))
+        self.uploader.submit(name, data, os.path.join(*drive_path.split(os.sep)[1:]))
 
     def _save_results(self):
         """
@@ -168,59 +212,51 @@ class Model:
 
         shutil.rmtree(self.save_dir, ignore_errors=True)
 
+    def _stream_predict(self, model, dir_images: str):
+        """
+        Потоковый инференс по папке пачками INFER_BATCH изображений.
+        Результаты отдаются по одному и не накапливаются в памяти; путь исходного
+        изображения берётся из самого результата (result.path).
+        """
+        batch = max(1, int(os.environ.get("INFER_BATCH", "16")))
+        return model.predict(
+            dir_images,
+            stream=True,
+            batch=batch,
+            project=self.save_dir,
+            device=self.device,
+            verbose=False,
+        )
+
     def _process_image_seg(self, dir_images: str):
         """
         Вспомогательный метод для обработки изображения в задаче сегментации.
         Параметры:
             dir_images (str): абсолютный путь до папки с тестируемыми изображениями
         """
-        model = YOLO(self.path_model)
-        images_path = [os.path.join(dir_images, x) for x in os.listdir(dir_images)]
-        results = model(dir_images, project=self.save_dir, device=self.device, batch=-1)
-
-        for result, path_image in zip(results, images_path):
+        model = get_registry().get(self.path_model)
+        for result in self._stream_predict(model, dir_images):
+            path_image = result.path
             image_name, image_ext = os.path.splitext(os.path.basename(path_image))
             try:
                 classes_names = result.names
                 classes = result.boxes.cls.cpu().numpy()
-                masks = result.masks.data.cpu().numpy()
+                masks = result.masks.data
             except Exception as e:
-                image = Image.open(path_image)
-                new_path_image = os.path.join(self.path_result, f"{image_name}_yolo{image_ext}")
-                image.save(new_path_image)
-                upload_to_drive(new_path_image, os.path.join(*os.path.join(self.folder, 'result').split(os.sep)[1:]))
+                with open(path_image, 'rb') as f:
+                    self._emit(f"{image_name}_yolo{image_ext}", f.read())
                 continue
-            
-            image_orig = result.orig_img
+
             h_or, w_or = result.orig_shape
+            masks = resize_masks(masks, h_or, w_or)
 
-            image = Image.fromarray(image_orig)
-            image = image.resize((640, 640))
-
-            for i, mask in enumerate(masks):
-                mask = Image.fromarray((mask * 255).astype(np.uint8))
-                mask_resized = mask.resize((w_or, h_or))
-                
-                mask_resized_np = np.array(mask_resized)
-                color = self.colors[int(classes[i]) % len(self.colors)]
-                color_mask = np.zeros((h_or, w_or, 3), dtype=np.uint8)
-                color_mask[mask_resized_np > 0] = color
-                color_mask_img = Image.fromarray(color_mask)
-
-                path_mask = os.path.join(self.path_result, 'masks')
-                mask_filename = os.path.join(path_mask, f"{image_name}_{classes_names[int(classes[i])]}_{i}{image_ext}")
-                color_mask_img.save(mask_filename)
-                upload_to_drive(mask_filename, os.path.join(*os.path.join(self.folder, 'result', 'masks').split(os.sep)[1:]))
-                
-                image_orig = np.array(image_orig).astype(np.float32)
-                blended_image = image_orig * 1.0 + color_mask * 0.5
-                image_orig = np.clip(blended_image, 0, 255).astype(np.uint8) 
-
-            new_path_image = os.path.join(self.path_result, f"{image_name}_yolo{image_ext}")
-            final_image = Image.fromarray(image_orig)
+            for i, color_mask in enumerate(iter_instance_masks(masks, classes, self.palette)):
+                mask_name = f"masks/{image_name}_{classes_names[int(classes[i])]}_{i}{image_ext}"
+                self._emit(mask_name, encode_image(Image.fromarray(color_mask), image_ext))
 
-            final_image.save(new_path_image)
-            upload_to_drive(new_path_image, os.path.join(*os.path.join(self.folder, 'result').split(os.sep)[1:]))
+            image_orig = blend_overlay(result.orig_img, masks, classes, self.palette)
+            final_image = Image.fromarray(image_orig)
+            self._emit(f"{image_name}_yolo{image_ext}", encode_image(final_image, image_ext))
 
     def _process_image_cls(self, dir_images: str):
         """
@@ -228,23 +264,15 @@ class Model:
         Параметры:
             dir_images (str): абсолютный путь до папки с тестируемыми изображениями
         """
-        model = YOLO(self.path_model)
-        images_path = [os.path.join(dir_images, x) for x in os.listdir(dir_images)]
-        results = model(dir_images, project=self.save_dir, device=self.device, batch=-1)
-
-        for result, path_image in zip(results, images_path):
+        model = get_registry().get(self.path_model)
+        for result in self._stream_predict(model, dir_images):
+            path_image = result.path
             image_name, _ = os.path.splitext(os.path.basename(path_image))
             try:
                 classes_names = result.names
             except Exception:
-                filename = os.path.join(self.path_result, f"{image_name}_pred.txt")
-                with open(filename, mode="wt", encoding='utf-8') as pred:
-                    pred.write('Null')
-                upload_to_drive(filename, os.path.join(*os.path.join(self.folder, 'result').split(os.sep)[1:]))
+                self._emit(f"{image_name}_pred.txt", 'Null'.encode('utf-8'))
                 continue
 
-            filename = os.path.join(self.path_result, f"{image_name}_pred.txt")
-            with open(filename, mode="wt", encoding='utf-8') as pred:
-                pred.write(classes_names[np.argmax(result.probs.data.cpu().numpy())])
-            upload_to_drive(filename, os.path.join(*os.path.join(self.folder, 'result').split(os.sep)[1:]))
-        
\ No newline at end of file
+            prediction = classes_names[np.argmax(result.probs.data.cpu().numpy())]
+            self._emit(f"{image_name}_pred.txt", prediction.encode('utf-8'))
@@ -0,0 +1,69 @@
+"""Пул процессов для CPU-тяжёлых этапов worker (перебор imgsz, аугментации)."""
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# Ошибки запуска дочерних процессов (в т.ч. из daemon-процесса Celery prefork):
+# вызывающий код в этом случае выполняет работу последовательно.
+POOL_START_ERRORS = (AssertionError, OSError, BrokenProcessPool)
+
+
+def _cgroup_cpu_quota() -> float | None:
+    """Квота CPU контейнера (cgroup v2 cpu.max или v1 cfs_quota), в ядрах."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max", encoding="ascii") as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", encoding="ascii") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", encoding="ascii") as f:
+            period = int(f.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus() -> int:
+    """Число ядер, доступных процессу (с учётом affinity и квоты cgroup)."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, int(quota))
+    return max(1, cpus)
+
+
+def parse_workers(value: str | None, tasks: int, min_cpus_per_worker: int = 1) -> int:
+    """
+    Число процессов пула из строки настройки: целое число или 'auto'
+    (по ядрам, не меньше min_cpus_per_worker на процесс), не больше числа задач.
+    """
+    value = (value or "1").strip().lower()
+    if value in ("auto", "0"):
+        workers = available_cpus() // max(1, min_cpus_per_worker)
+    else:
+        try:
+            workers = int(value)
+        except ValueError:
+            logger.warning("Некорректное число процессов %r, используется 1", value)
+            workers = 1
+    return max(1, min(workers, tasks))
+
+
+def make_process_pool(workers: int, initializer=None, initargs=()) -> ProcessPoolExecutor:
+    """ProcessPoolExecutor на spawn: безопасно для torch/CUDA в дочерних процессах."""
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer,
+        initargs=initargs,
+    )
@@ -0,0 +1,137 @@
+"""
+Реестр загруженных YOLO-моделей процесса worker.
+
+Повторный инференс по той же папке берёт модель из памяти, без загрузки весов.
+Ключ — путь к весам, mtime и размер файла: перезапись last_N.pt даёт новый ключ.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from ultralytics import YOLO
+
+logger = logging.getLogger(__name__)
+
+RECENT_FILE = ".model_cache_recent.json"
+RECENT_LIMIT = 16
+
+
+def _weights_key(path_model: str) -> tuple[str, int, int]:
+    path = os.path.realpath(path_model)
+    st = os.stat(path)
+    return path, st.st_mtime_ns, st.st_size
+
+
+def _model_bytes(model: YOLO, fallback: int) -> int:
+    """Оценка памяти модели по параметрам и буферам torch."""
+    try:
+        net = model.model
+        tensors = list(net.parameters()) + list(net.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors) or fallback
+    except Exception:
+        return fallback
+
+
+def _recent_path() -> str:
+    return os.path.join(os.environ.get("ML_DATA_PATH", "/data"), RECENT_FILE)
+
+
+def _load_recent() -> list[str]:
+    try:
+        with open(_recent_path(), encoding="utf-8") as f:
+            data = json.load(f)
+        return [p for p in data if isinstance(p, str)]
+    except (OSError, ValueError):
+        return []
+
+
+def _remember(path: str) -> None:
+    """Запомнить путь весов в списке недавно использованных (общий файл на томе данных)."""
+    recent = [path] + [p for p in _load_recent() if p != path]
+    target = _recent_path()
+    try:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix=RECENT_FILE)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(recent[:RECENT_LIMIT], f)
+        os.replace(tmp, target)
+    except OSError as e:
+        logger.debug("Не удалось обновить %s: %s", target, e)
+
+
+class ModelRegistry:
+    """
+    LRU-кэш моделей с ограничением по числу и по памяти.
+
+    Атрибуты:
+        max_models (int): Максимум моделей в памяти.
+        max_bytes (int): Максимум суммарного объёма параметров моделей.
+    """
+
+    def __init__(self, max_models: int, max_bytes: int):
+        self.max_models = max(1, max_models)
+        self.max_bytes = max_bytes
+        self._models: OrderedDict[tuple[str, int, int], tuple[YOLO, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path_model: str) -> YOLO:
+        """Модель из кэша или загрузка весов с вытеснением давно не использованных."""
+        key = _weights_key(path_model)
+        with self._lock:
+            cached = self._models.get(key)
+            if cached is not None:
+                self._models.move_to_end(key)
+        if cached is not None:
+            _remember(key[0])
+            return cached[0]
+
+        model = YOLO(key[0])
+        size = _model_bytes(model, key[2])
+        with self._lock:
+            # Старые версии тех же весов больше не понадобятся
+            for stale in [k for k in self._models if k[0] == key[0] and k != key]:
+                del self._models[stale]
+            self._models[key] = (model, size)
+            self._evict()
+        _remember(key[0])
+        logger.info("Модель %s загружена в кэш (%.1f МБ)", key[0], size / 2**20)
+        return model
+
+    def _evict(self) -> None:
+        total = sum(size for _, size in self._models.values())
+        while len(self._models) > 1 and (
+            len(self._models) > self.max_models or total > self.max_bytes
+        ):
+            key, (_, size) = self._models.popitem(last=False)
+            total -= size
+            logger.info("Модель %s вытеснена из кэша", key[0])
+
+    def preload(self, limit: int) -> None:
+        """Загрузить до limit недавно использованных моделей (worker_process_init)."""
+        # С конца: самая недавняя модель окажется последней загруженной (MRU)
+        for path in reversed(_load_recent()[: min(limit, self.max_models)]):
+            if not os.path.isfile(path):
+                continue
+            try:
+                self.get(path)
+            except Exception as e:
+                logger.warning("Не удалось предзагрузить %s: %s", path, e)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+
+_registry: ModelRegistry | None = None
+
+
+def get_registry() -> ModelRegistry:
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry(
+            max_models=int(os.environ.get("MODEL_CACHE_MAX_MODELS", "2")),
+            max_bytes=int(float(os.environ.get("MODEL_CACHE_MAX_MB", "2048")) * 2**20),
+        )
+    return _registry
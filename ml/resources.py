@@ -0,0 +1,154 @@
+"""
+Профиль ресурсов ML worker: ядра, память и лимиты cgroup определяются при старте
+процесса и задают batch, dataloader workers и потоки torch для обучения.
+Ресурсы делятся поровну между процессами пула Celery (их число worker определяет
+при старте: --concurrency, worker_concurrency или число ядер): каждый дочерний
+процесс получает свою долю ядер и памяти. Любой параметр можно
+зафиксировать в настройках worker (TRAIN_* в backend.config).
+"""
+import logging
+from dataclasses import dataclass
+
+import torch
+
+from backend.config import settings
+from ml.parallel import available_cpus
+
+logger = logging.getLogger(__name__)
+
+# Доля доступной памяти под активации обучения на CPU; остальное — данные,
+# процессы dataloader и запас
+CPU_MEMORY_SHARE = 0.5
+# Память одного dataloader worker (декодированные изображения, очередь prefetch)
+LOADER_WORKER_BYTES = 512 * 2**20
+MAX_CPU_BATCH = 64
+
+
+def _read_int(path: str) -> int | None:
+    try:
+        with open(path, encoding="ascii") as f:
+            value = f.read().strip()
+        return None if value == "max" else int(value)
+    except (OSError, ValueError):
+        return None
+
+
+def _available_memory() -> int:
+    """Свободная память с учётом лимита cgroup (v2 memory.max или v1 limit_in_bytes)."""
+    available = None
+    try:
+        with open("/proc/meminfo", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    if available is None:
+        available = 4 * 2**30
+    for limit_path, usage_path in (
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes"),
+    ):
+        limit = _read_int(limit_path)
+        # v1 без лимита отдаёт огромное число
+        if limit is None or limit >= 2**60:
+            continue
+        usage = _read_int(usage_path) or 0
+        return max(0, min(available, limit - usage))
+    return available
+
+
+def _floor_pow2(value: float) -> int:
+    power = 1
+    while power * 2 <= value:
+        power *= 2
+    return power
+
+
+@dataclass(frozen=True)
+class ResourceProfile:
+    """
+    Параметры обучения под конкретный worker.
+
+    Атрибуты:
+        cpus (int): Доступные ядра (affinity и квота cgroup).
+        memory_bytes (int): Доступная память (MemAvailable и лимит cgroup).
+        gpu (bool): Есть ли CUDA.
+        workers (int): dataloader workers.
+        threads (int): Потоки torch (intra-op).
+        epochs (int): Эпохи основного обучения.
+        fine_tune_epochs (int): Эпохи дообучения.
+    """
+
+    cpus: int
+    memory_bytes: int
+    gpu: bool
+    workers: int
+    threads: int
+    epochs: int
+    fine_tune_epochs: int
+
+    def batch_for(self, imgsz: int | None, memory_share: float = 1.0) -> int:
+        """
+        Размер batch для imgsz. На GPU — AutoBatch Ultralytics (-1); на CPU — по памяти:
+        степень двойки, при которой активации укладываются в CPU_MEMORY_SHARE памяти.
+        memory_share — доля ресурсов worker на один прогон (параллельный перебор imgsz).
+        imgsz None — как для 640.
+        """
+        if settings.TRAIN_BATCH:
+            return settings.TRAIN_BATCH
+        if self.gpu:
+            return -1
+        budget = (
+            self.memory_bytes * memory_share * CPU_MEMORY_SHARE
+            - self.workers * LOADER_WORKER_BYTES
+        )
+        per_image = settings.TRAIN_MEMORY_PER_IMAGE_MB * 2**20 * ((imgsz or 640) / 640) ** 2
+        return min(MAX_CPU_BATCH, _floor_pow2(max(1.0, budget / per_image)))
+
+    def apply(self) -> None:
+        """Выставить число потоков torch в текущем процессе."""
+        torch.set_num_threads(self.threads)
+
+
+def probe(processes: int = 1) -> ResourceProfile:
+    """
+    Определить долю ресурсов этого процесса worker (1/processes ядер и памяти) и
+    вывести из неё параметры обучения.
+    """
+    processes = max(1, processes)
+    cpus = max(1, available_cpus() // processes)
+    workers = settings.TRAIN_WORKERS
+    if workers is None:
+        workers = min(8, max(1, cpus // 4))
+    threads = settings.TRAIN_THREADS or max(1, cpus - workers)
+    return ResourceProfile(
+        cpus=cpus,
+        memory_bytes=_available_memory() // processes,
+        gpu=torch.cuda.is_available(),
+        workers=workers,
+        threads=threads,
+        epochs=settings.TRAIN_EPOCHS,
+        fine_tune_epochs=settings.FINE_TUNE_EPOCHS,
+    )
+
+
+_profile: ResourceProfile | None = None
+
+
+def get_profile(processes: int | None = None) -> ResourceProfile:
+    """Профиль процесса (определяется один раз); processes — процессов в пуле worker."""
+    global _profile
+    if _profile is None:
+        _profile = probe(processes or 1)
+        logger.info(
+            "Профиль ресурсов (процессов в пуле %d): cpus=%d, память=%.1f ГБ, gpu=%s, workers=%d, threads=%d",
+            processes or 1,
+            _profile.cpus,
+            _profile.memory_bytes / 2**30,
+            _profile.gpu,
+            _profile.workers,
+            _profile.threads,
+        )
+    return _profile
@@ -0,0 +1,74 @@
+"""
+Приёмники артефактов инференса: каталог на диске или сразу ZIP-архив результатов.
+
+ZipSink пишет каждый файл в архив по мере появления, без промежуточного results/
+и повторного чтения при упаковке. PNG/JPEG уже сжаты и хранятся без deflate.
+"""
+import io
+import os
+import time
+import zipfile
+
+from PIL import Image
+
+STORED_EXTS = {".png", ".jpg", ".jpeg", ".webp", ".gif"}
+
+
+def encode_image(image: Image.Image, ext: str) -> bytes:
+    """Закодировать изображение в формат по расширению файла."""
+    image_format = Image.registered_extensions().get(ext.lower(), "PNG")
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+class DirectorySink:
+    """Запись артефактов в каталог (прежнее поведение Model.predict)."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.count = 0
+
+    def write(self, arcname: str, data: bytes) -> None:
+        path = os.path.join(self.root, *arcname.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        self.count += 1
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ZipSink:
+    """Потоковая запись артефактов в ZIP; сжатые форматы — ZIP_STORED, остальное — deflate."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._zf = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED)
+
+    def write(self, arcname: str, data: bytes) -> None:
+        info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+        info.external_attr = 0o644 << 16
+        if os.path.splitext(arcname)[1].lower() in STORED_EXTS:
+            info.compress_type = zipfile.ZIP_STORED
+        else:
+            info.compress_type = zipfile.ZIP_DEFLATED
+        self._zf.writestr(info, data)
+        self.count += 1
+
+    def close(self) -> None:
+        self._zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
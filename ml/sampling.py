@@ -0,0 +1,94 @@
+"""
+Виртуальная балансировка классов классификации (BALANCE_MODE=weighted).
+
+Вместо аугментированных копий на диске разбиение записывает в data_root
+sampling.json с весами классов, а обучение берёт примеры train через
+WeightedRandomSampler: редкие классы выбираются чаще, аугментации Ultralytics
+применяются к каждому извлечению заново, поэтому повторы не совпадают.
+"""
+import json
+import logging
+import os
+
+import torch
+from torch.utils.data import WeightedRandomSampler
+from ultralytics.data.build import InfiniteDataLoader, seed_worker
+from ultralytics.data.utils import PIN_MEMORY
+from ultralytics.models.yolo.classify import ClassificationTrainer
+from ultralytics.utils import RANK
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_FILE = "sampling.json"
+BALANCE_MODES = ("materialize", "weighted")
+
+
+def write_sampling(output_dir: str, class_counts: dict[str, int]) -> dict[str, float]:
+    """
+    Записать веса классов: вес класса — отношение размера самого большого класса к его
+    размеру (как augment_factor + 1 в режиме materialize, но без округления).
+    """
+    max_count = max(class_counts.values())
+    weights = {name: max_count / count for name, count in sorted(class_counts.items()) if count}
+    with open(os.path.join(output_dir, SAMPLING_FILE), "w", encoding="utf-8") as f:
+        json.dump({"class_weights": weights}, f, ensure_ascii=False, indent=2)
+    return weights
+
+
+def load_class_weights(path_dataset: str) -> dict[str, float] | None:
+    """Веса классов из data_root (None — балансировка не задана)."""
+    path = os.path.join(path_dataset, SAMPLING_FILE)
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("class_weights") or None
+
+
+def trainer_for(path_dataset: str):
+    """Класс trainer для YOLO.train(): взвешенный, если в data_root есть sampling.json."""
+    if os.path.isdir(path_dataset) and load_class_weights(path_dataset):
+        return WeightedClassificationTrainer
+    return None
+
+
+class WeightedClassificationTrainer(ClassificationTrainer):
+    """ClassificationTrainer, у которого train-загрузчик выбирает примеры по весам классов."""
+
+    def get_dataloader(self, dataset_path, batch_size=16, rank=0, mode="train"):
+        weights = load_class_weights(str(self.args.data)) if mode == "train" else None
+        # DDP (rank != -1) — стандартный загрузчик с DistributedSampler
+        if not weights or rank != -1:
+            return super().get_dataloader(dataset_path, batch_size, rank, mode)
+
+        dataset = self.build_dataset(dataset_path, mode)
+        names = dataset.base.classes
+        sample_weights = torch.tensor(
+            [weights.get(names[sample[1]], 1.0) for sample in dataset.samples],
+            dtype=torch.double,
+        )
+        # Длина эпохи — как у выборки с материализованными копиями
+        num_samples = max(len(dataset.samples), round(float(sample_weights.sum())))
+        generator = torch.Generator()
+        generator.manual_seed(self.args.seed)
+        sampler = WeightedRandomSampler(
+            sample_weights, num_samples=num_samples, replacement=True, generator=generator
+        )
+        logger.info(
+            "Взвешенная выборка классов: %d изображений, %d примеров за эпоху",
+            len(dataset.samples),
+            num_samples,
+        )
+        loader_generator = torch.Generator()
+        loader_generator.manual_seed(6148914691236517205 + RANK)
+        nd = torch.cuda.device_count()
+        return InfiniteDataLoader(
+            dataset=dataset,
+            batch_size=min(batch_size, num_samples),
+            shuffle=False,
+            num_workers=min(os.cpu_count() // max(nd, 1), self.args.workers),
+            sampler=sampler,
+            pin_memory=PIN_MEMORY,
+            collate_fn=getattr(dataset, "collate_fn", None),
+            worker_init_fn=seed_worker,
+            generator=loader_generator,
+        )